@@ -0,0 +1,198 @@
+"""
+Throughput benchmark for the unit parsing and RadLex synonym pipelines, run against the local mock backend.
+
+For every pipeline and input size, a synthetic input file is generated and processed in a separate Python
+process, and groups/sec, p50/p99 group latency, checkpoint overhead, final export time, peak memory and input tokens per
+call are reported. Run once with --no-system-instruction to measure the savings of sending the static
+instructions separately.
+
+    python benchmarks/bench_pipelines.py
+    python benchmarks/bench_pipelines.py --sizes 1000 --pipelines unit_parsing --latency 0.2 --workers 16
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+PIPELINES = ['unit_parsing', 'radlex_synonym']
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Vocabulary of the synthetic inputs
+LOCATIONS = ['upper lobe of right lung', 'lower lobe of left lung', 'mediastinal lymph node', 'right kidney',
+             'left adrenal gland', 'pleural space', 'thyroid gland', 'liver segment 7', 'main pulmonary artery',
+             'right middle lobe', 'left axillary lymph node', 'pericardium', 'aortic arch', 'spleen']
+FINDINGS = ['nodular opacity', 'consolidation', 'ground-glass opacity', 'bronchiectasis', 'atelectasis',
+            'reticular opacity', 'pleural effusion', 'lymphadenopathy', 'calcification', 'emphysema',
+            'centrilobular nodule', 'bronchial wall thickening', 'fibrosis', 'cyst', 'mass', 'stent']
+MODIFIERS = ['mild', 'moderate', 'severe', 'diffuse', 'focal', 'subtle', 'new', 'stable', 'decreased',
+             'increased', 'small', 'large', 'ill-defined', 'multiple']
+
+
+def synthetic_report(rng):
+    phrases = []
+    for _ in range(rng.randint(3, 8)):
+        phrases.append(f"{rng.choice(MODIFIERS)} {rng.choice(FINDINGS)} in {rng.choice(LOCATIONS)}")
+    return ' '.join(phrases)
+
+
+def synthetic_term(rng, row):
+    return f"{rng.choice(MODIFIERS)} {rng.choice(FINDINGS)} {row}"
+
+
+def write_input(pipeline, rows, path, seed=0):
+    """
+    Writes a synthetic input workbook in the layout the pipeline reads.
+    """
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    if pipeline == 'unit_parsing':
+        for _ in range(rows):
+            sheet.append([synthetic_report(rng)])
+    else:
+        sheet.append(['Preferred Label'])
+        for row in range(rows):
+            sheet.append([synthetic_term(rng, row)])
+    workbook.save(path)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident memory of this process in MB, or None where it cannot be measured.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_one(pipeline, rows, work_dir, args):
+    """
+    Runs one pipeline over a synthetic input of the given size in this process and returns its measurements.
+    """
+    import importlib
+
+    module = importlib.import_module(f"radlex_expansion.{pipeline}")
+    input_file = os.path.join(work_dir, f"{pipeline}-{rows}.xlsx")
+    output_file = os.path.join(work_dir, f"{pipeline}-{rows}-output.csv")
+    write_input(pipeline, rows, input_file, seed=args.seed)
+
+    module.use_system_instruction = not args.no_system_instruction
+    backend = module.create_model_backend('mock', latency=args.latency, latency_jitter=args.latency_jitter,
+                                          error_rate=args.error_rate, truncation_rate=args.truncation_rate,
+                                          seed=args.seed)
+    process = module.process_reports if pipeline == 'unit_parsing' else module.process_lexicons
+    group_size = 'reports_per_group' if pipeline == 'unit_parsing' else 'lexicon_per_group'
+
+    start = time.perf_counter()
+    # The pipelines print a line per group, which would dominate the benchmark output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        summary = process(input_file, output_file, max_workers=args.workers, backend=backend,
+                          streaming=args.streaming, **{group_size: getattr(module, group_size)})
+    wall_time = time.perf_counter() - start
+
+    elapsed = summary['elapsed']
+    usage = summary['usage']
+    return {
+        'pipeline': pipeline,
+        'rows': rows,
+        'groups': summary['groups'],
+        'api_calls': backend.calls,
+        'groups_per_sec': summary['groups'] / elapsed if elapsed else 0.0,
+        'p50_latency': percentile(summary['group_latencies'], 0.50),
+        'p99_latency': percentile(summary['group_latencies'], 0.99),
+        'checkpoint_time': summary['checkpoint_time'],
+        'checkpoint_overhead': summary['checkpoint_time'] / elapsed if elapsed else 0.0,
+        'export_time': summary['export_time'],
+        'elapsed': elapsed,
+        'wall_time': wall_time,
+        'peak_memory_mb': peak_memory_mb(),
+        'input_tokens_per_call': usage['input_tokens_per_call'],
+        'uncached_input_tokens_per_call': usage['uncached_input_tokens_per_call'],
+        'output_tokens_per_call': usage['output_tokens_per_call'],
+    }
+
+
+def print_table(results):
+    header = (f"{'pipeline':<16}{'rows':>8}{'groups':>8}{'groups/s':>10}{'p50 s':>9}{'p99 s':>9}"
+              f"{'ckpt s':>9}{'ckpt %':>8}{'export s':>10}{'peak MB':>9}{'in tok':>8}{'uncached':>10}")
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        peak = result['peak_memory_mb']
+        print(f"{result['pipeline']:<16}{result['rows']:>8}{result['groups']:>8}"
+              f"{result['groups_per_sec']:>10.1f}{result['p50_latency']:>9.3f}{result['p99_latency']:>9.3f}"
+              f"{result['checkpoint_time']:>9.2f}{result['checkpoint_overhead']:>8.1%}{result['export_time']:>10.2f}"
+              f"{(f'{peak:.0f}' if peak is not None else 'n/a'):>9}"
+              f"{result['input_tokens_per_call']:>8.0f}{result['uncached_input_tokens_per_call']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=PIPELINES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="input rows per run")
+    parser.add_argument('--workers', type=int, default=8, help="groups in flight at once")
+    parser.add_argument('--latency', type=float, default=0.0, help="mock response latency in seconds")
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--truncation-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--streaming', action='store_true', help="stream responses and parse them incrementally")
+    parser.add_argument('--no-system-instruction', action='store_true',
+                        help="repeat the static instructions in every prompt")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    parser.add_argument('--single', nargs=2, metavar=('PIPELINE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Child process: run one benchmark and report it as the last line of output
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = run_one(args.single[0], int(args.single[1]), work_dir, args)
+        print(json.dumps(result))
+        return
+
+    # Each run gets its own process so that peak memory is measured per run
+    results = []
+    child_args = ['--workers', str(args.workers), '--latency', str(args.latency),
+                  '--latency-jitter', str(args.latency_jitter), '--error-rate', str(args.error_rate),
+                  '--truncation-rate', str(args.truncation_rate), '--seed', str(args.seed)]
+    if args.streaming:
+        child_args.append('--streaming')
+    if args.no_system_instruction:
+        child_args.append('--no-system-instruction')
+    for pipeline in args.pipelines:
+        for rows in args.sizes:
+            print(f"Running {pipeline} with {rows} rows...", file=sys.stderr)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), *child_args,
+                                     '--single', pipeline, str(rows)],
+                                    check=True, capture_output=True, text=True, cwd=REPO_DIR).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
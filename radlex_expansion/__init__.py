@@ -0,0 +1,4 @@
+"""
+LLM-generated expansion of the RadLex ontology: unit parsing of reports, RadLex synonym generation and
+mapping of parsed units to RadLex terms. See cli.py for the command-line entry point.
+"""
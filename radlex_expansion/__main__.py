@@ -0,0 +1,8 @@
+"""
+Runs the command-line interface as python -m radlex_expansion.
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
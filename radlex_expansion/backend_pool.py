@@ -0,0 +1,224 @@
+import threading
+import time
+
+from .backends import TokenUsage
+from .dispatch import RateLimiter, estimate_tokens
+from .failure_isolation import classify_error
+
+# Error classes after which a request is sent to the next pool member; other errors (e.g. a safety block)
+# depend on the prompt, so another member would fail the same way
+FAILOVER_ERROR_CLASSES = {'quota', 'transport', 'other'}
+
+
+def served_by(backend):
+    """
+    Returns the label of the backend that served the calling thread's last request ("name:model", or the
+    label of the member that answered for a BackendPool).
+    """
+    if isinstance(backend, BackendPool):
+        return backend.served_by()
+    return f"{backend.name}:{backend.model_name}"
+
+
+class PoolMember:
+    """
+    One credential/model pair of a BackendPool, with its own quota, health and circuit state.
+    """
+
+    def __init__(self, backend, label=None, requests_per_minute=None, tokens_per_minute=None):
+        self.backend = backend
+        self.label = label or f"{backend.name}:{backend.model_name}"
+        self.rate_limiter = None
+        if requests_per_minute or tokens_per_minute:
+            self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.state = 'closed'  # closed (in use), open (cooling down) or half-open (one trial request in flight)
+        self.reopen_at = 0.0
+        self.cooldown = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # Moving average of successful call latency in seconds
+
+
+class BackendPool:
+    """
+    Spreads requests across several credential/model pairs (PoolMembers) with failover.
+
+    Each request goes to the available member with the fewest requests in flight, after waiting for that
+    member's own quota. A quota, transport or other API error fails the request over to the next member.
+    A member's circuit opens after a quota error or failure_threshold consecutive failures: it gets no
+    requests for cooldown seconds, doubling up to max_cooldown while it keeps failing, and then a single
+    trial request decides whether it closes again. When every circuit is open, requests wait for the first
+    one to reopen. The request fails only when every member failed it.
+
+    The pool is used like any other backend; all members must share the system instruction.
+    served_by() names the member that answered the calling thread's last request.
+    """
+
+    name = 'pool'
+
+    def __init__(self, members, failure_threshold=3, cooldown=30.0, max_cooldown=600.0):
+        if not members:
+            raise ValueError("A backend pool needs at least one member.")
+        self.members = list(members)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        first = self.members[0].backend
+        self.model_name = '+'.join(dict.fromkeys(member.backend.model_name for member in self.members))
+        self.generation_config = first.generation_config
+        self.system_instruction = getattr(first, 'system_instruction', None)
+        self.usage = TokenUsage()
+        self._rotation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def served_by(self):
+        return getattr(self._local, 'label', None)
+
+    def _pick(self, tried):
+        """
+        Returns (member, None) for the next member to try, (None, seconds) if all untried members are cooling
+        down, or (None, None) if every member was tried.
+        """
+        now = time.monotonic()
+        untried = [member for member in self.members if member not in tried]
+        if not untried:
+            return None, None
+        available = [member for member in untried
+                     if member.state == 'closed' or (member.state == 'open' and now >= member.reopen_at)]
+        if not available:
+            waits = [member.reopen_at - now for member in untried if member.state == 'open']
+            return None, max(0.05, min(waits, default=1.0))
+
+        # Rotate the starting point so that equally loaded members take turns
+        self._rotation = (self._rotation + 1) % len(self.members)
+        member = min(available, key=lambda member: (
+            member.in_flight, (self.members.index(member) - self._rotation) % len(self.members)))
+        if member.state == 'open':
+            member.state = 'half-open'
+        member.in_flight += 1
+        return member, None
+
+    def _finish(self, member, latency, error=None):
+        """
+        Updates a member's health after a request; returns True if the request should fail over.
+        """
+        error_class = classify_error(error) if error is not None else None
+        with self._lock:
+            member.in_flight -= 1
+            member.calls += 1
+            if error_class not in FAILOVER_ERROR_CLASSES:
+                # The member answered; an error about the prompt itself is not the member's fault
+                member.consecutive_failures = 0
+                member.cooldown = 0.0
+                member.state = 'closed'
+                member.latency = latency if member.latency is None else 0.8 * member.latency + 0.2 * latency
+                return False
+            member.failures += 1
+            member.consecutive_failures += 1
+            if (member.state == 'half-open' or error_class == 'quota'
+                    or member.consecutive_failures >= self.failure_threshold):
+                member.cooldown = min(self.max_cooldown, member.cooldown * 2 or self.cooldown)
+                member.state = 'open'
+                member.reopen_at = time.monotonic() + member.cooldown
+                print(f"Backend {member.label}: circuit opened for {member.cooldown:.0f} seconds "
+                      f"after a {error_class} error: {error}")
+            return True
+
+    def _members(self, prompt):
+        """
+        Yields the members to try for one request in turn, each after its quota allows the request.
+        """
+        tried = set()
+        while True:
+            with self._lock:
+                member, wait = self._pick(tried)
+            if member is None:
+                if wait is None:
+                    return
+                time.sleep(wait)
+                continue
+            tried.add(member)
+            if member.rate_limiter is not None:
+                member.rate_limiter.acquire(estimate_tokens(prompt))
+            yield member
+
+    def generate(self, prompt):
+        last_error = None
+        for member in self._members(prompt):
+            call_start = time.monotonic()
+            try:
+                response = member.backend.generate(prompt)
+            except Exception as e:
+                if not self._finish(member, time.monotonic() - call_start, e):
+                    raise
+                print(f"Backend {member.label} failed ({classify_error(e)}); failing over.")
+                last_error = e
+                continue
+            self._finish(member, time.monotonic() - call_start)
+            self._local.label = member.label
+            self.usage.record(response)
+            return response
+        raise last_error
+
+    def stream(self, prompt):
+        """
+        Streams from the first member that starts answering; a stream that already produced chunks is not
+        failed over, since they may have been consumed.
+        """
+        last_error = None
+        for member in self._members(prompt):
+            call_start = time.monotonic()
+            chunks = member.backend.stream(prompt)
+            try:
+                first_chunk = next(chunks, None)
+            except Exception as e:
+                if not self._finish(member, time.monotonic() - call_start, e):
+                    raise
+                print(f"Backend {member.label} failed ({classify_error(e)}); failing over.")
+                last_error = e
+                continue
+            self._local.label = member.label
+            error = None
+            try:
+                chunk = first_chunk
+                while chunk is not None:
+                    if chunk.input_tokens is not None:
+                        self.usage.record(chunk)
+                    yield chunk
+                    chunk = next(chunks, None)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._finish(member, time.monotonic() - call_start, error)
+            return
+        raise last_error
+
+    def health(self):
+        """
+        Returns the state, call and failure counts and average latency of every member.
+        """
+        with self._lock:
+            return [{'backend': member.label, 'state': member.state, 'calls': member.calls,
+                     'failures': member.failures, 'latency': member.latency} for member in self.members]
+
+    def close(self):
+        for status in self.health():
+            latency = f"{status['latency']:.2f} s" if status['latency'] is not None else "n/a"
+            print(f"Backend {status['backend']}: {status['calls']} calls, {status['failures']} failed, "
+                  f"average latency {latency}, circuit {status['state']}.")
+        for member in self.members:
+            member.backend.close()
+
+
+def tag_backend(results, label):
+    """
+    Records in each parsed result (a dict) the backend that produced it, under 'backend'.
+    """
+    for result in results:
+        if isinstance(result, dict):
+            result.setdefault('backend', label)
+    return results
@@ -0,0 +1,447 @@
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from .dispatch import estimate_tokens
+
+# Text and metadata of one model response; token counts are None when the backend does not report them.
+# cached_tokens is the part of input_tokens that was served from a cached context.
+ModelResponse = namedtuple('ModelResponse', ['text', 'finish_reason', 'input_tokens', 'output_tokens',
+                                             'cached_tokens'], defaults=(None,))
+
+
+def prompt_key(prompt, system_instruction=None):
+    """
+    Returns the key under which a response to prompt is recorded. A prompt sent with a system instruction
+    gets the same key as the instruction and prompt sent as one text.
+    """
+    if system_instruction:
+        prompt = f"{system_instruction}\n\n{prompt}".strip()
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class TokenUsage:
+    """
+    Thread-safe running totals of the calls and tokens of a backend.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, response):
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += response.input_tokens or 0
+            self.cached_tokens += response.cached_tokens or 0
+            self.output_tokens += response.output_tokens or 0
+
+    def summary(self):
+        """
+        Returns the totals and per-call averages; uncached input tokens are the ones billed at the full rate.
+        """
+        with self._lock:
+            calls = self.calls or 1
+            return {
+                'calls': self.calls,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'uncached_input_tokens': self.input_tokens - self.cached_tokens,
+                'output_tokens': self.output_tokens,
+                'input_tokens_per_call': self.input_tokens / calls,
+                'uncached_input_tokens_per_call': (self.input_tokens - self.cached_tokens) / calls,
+                'output_tokens_per_call': self.output_tokens / calls,
+            }
+
+
+class GeminiBackend:
+    """
+    Sends prompts to a Google Gemini model. The SDK is imported when the backend is created.
+
+    A system_instruction is sent with every call instead of being repeated in the prompts. With
+    context_cache_ttl (seconds), it is uploaded once as a cached context instead, which is re-created shortly
+    before it expires; if the cache cannot be created (e.g. the instruction is below the model's minimum
+    cache size), the backend falls back to the plain system instruction.
+
+    With an api_key, the backend calls the service through its own clients bound to that key, so that
+    backends with different keys (e.g. the members of a BackendPool) do not share the SDK's process-wide
+    configuration. Without one, the SDK's default clients read GOOGLE_API_KEY.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, model_name, api_key=None, generation_config=None, safety_settings=None,
+                 system_instruction=None, context_cache_ttl=None):
+        import google.generativeai as genai
+
+        self._client = None
+        self._cache_client = None
+        if api_key:
+            from google.ai import generativelanguage
+
+            client_options = {'api_key': api_key}
+            self._client = generativelanguage.GenerativeServiceClient(client_options=client_options)
+            self._cache_client = generativelanguage.CacheServiceClient(client_options=client_options)
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+        self.safety_settings = safety_settings
+        self.system_instruction = system_instruction
+        self.context_cache_ttl = context_cache_ttl if system_instruction else None
+        self.usage = TokenUsage()
+        self._genai = genai
+        self._model = self._bind(genai.GenerativeModel(model_name, system_instruction=system_instruction))
+        self._cached_content = None
+        self._cached_model = None
+        self._cache_expires = 0.0
+        self._lock = threading.Lock()
+
+    def _bind(self, model):
+        # The SDK only falls back to its default client when the model has none of its own
+        if self._client is not None:
+            model._client = self._client
+        return model
+
+    def _create_cache(self):
+        from google.generativeai import caching
+
+        ttl = datetime.timedelta(seconds=self.context_cache_ttl)
+        if self._cache_client is None:
+            return caching.CachedContent.create(model=self.model_name, system_instruction=self.system_instruction,
+                                                ttl=ttl)
+        request = caching.CachedContent._prepare_create_request(
+            model=self.model_name, system_instruction=self.system_instruction, ttl=ttl)
+        return caching.CachedContent._from_obj(self._cache_client.create_cached_content(request))
+
+    def _current_model(self):
+        """
+        Returns the model to call, creating or refreshing the cached context first if it is due.
+        """
+        if not self.context_cache_ttl:
+            return self._model
+        with self._lock:
+            if self.context_cache_ttl and time.monotonic() >= self._cache_expires:
+                try:
+                    self._cached_content = self._create_cache()
+                except Exception as e:
+                    print(f"Could not create a cached context, sending the system instruction instead: {e}")
+                    self.context_cache_ttl = None
+                    return self._model
+                self._cached_model = self._bind(self._genai.GenerativeModel.from_cached_content(self._cached_content))
+                # Refresh a little early so that no call reaches the service with an expired cache
+                self._cache_expires = time.monotonic() + self.context_cache_ttl * 0.9
+                print(f"Created cached context {self._cached_content.name} for {self.context_cache_ttl} seconds.")
+            return self._cached_model
+
+    def _expire_on_error(self, error):
+        # A cache that expired or was deleted early is re-created on the next attempt
+        if self.context_cache_ttl and type(error).__name__ in ('NotFound', 'PermissionDenied'):
+            with self._lock:
+                self._cache_expires = 0.0
+
+    @staticmethod
+    def _usage(usage):
+        return (getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None),
+                getattr(usage, 'cached_content_token_count', None))
+
+    def generate(self, prompt):
+        try:
+            response = self._current_model().generate_content(
+                [prompt], generation_config=self.generation_config, safety_settings=self.safety_settings)
+        except Exception as e:
+            self._expire_on_error(e)
+            raise
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+        result = ModelResponse(response.text, getattr(finish_reason, 'name', finish_reason),
+                               *self._usage(getattr(response, 'usage_metadata', None)))
+        self.usage.record(result)
+        return result
+
+    def stream(self, prompt):
+        """
+        Yields the response as ModelResponse chunks while it is generated; the last chunk carries the
+        finish reason and token counts.
+        """
+        try:
+            response = self._current_model().generate_content(
+                [prompt], generation_config=self.generation_config, safety_settings=self.safety_settings,
+                stream=True)
+        except Exception as e:
+            self._expire_on_error(e)
+            raise
+        last = None
+        for chunk in response:
+            finish_reason = chunk.candidates[0].finish_reason if chunk.candidates else None
+            parts = chunk.candidates[0].content.parts if chunk.candidates else []
+            last = ModelResponse(''.join(part.text for part in parts),
+                                 getattr(finish_reason, 'name', finish_reason) or None,
+                                 *self._usage(getattr(chunk, 'usage_metadata', None)))
+            yield last
+        if last is not None:
+            self.usage.record(last)
+
+    def close(self):
+        """
+        Deletes the cached context, if one was created.
+        """
+        if self._cached_content is not None:
+            try:
+                if self._cache_client is None:
+                    self._cached_content.delete()
+                else:
+                    self._cache_client.delete_cached_content(name=self._cached_content.name)
+            except Exception as e:
+                print(f"Could not delete cached context: {e}")
+            self._cached_content = None
+
+
+class OpenAIBackend:
+    """
+    Sends prompts to an OpenAI (or OpenAI-compatible) chat completions model.
+    The SDK is imported when the backend is created.
+    A system_instruction is sent as the leading system message, which the service caches automatically
+    as a shared prompt prefix.
+    """
+
+    name = 'openai'
+
+    def __init__(self, model_name, api_key=None, generation_config=None, base_url=None, system_instruction=None):
+        import openai
+
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+        self.system_instruction = system_instruction
+        self.usage = TokenUsage()
+        self._client = openai.OpenAI(api_key=api_key, base_url=base_url)
+
+    def _messages(self, prompt):
+        messages = [{'role': 'user', 'content': prompt}]
+        if self.system_instruction:
+            messages.insert(0, {'role': 'system', 'content': self.system_instruction})
+        return messages
+
+    @staticmethod
+    def _usage(usage):
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return (getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+                getattr(details, 'cached_tokens', None))
+
+    def _options(self):
+        options = {}
+        if self.generation_config.get('temperature') is not None:
+            options['temperature'] = self.generation_config['temperature']
+        if self.generation_config.get('max_output_tokens') is not None:
+            options['max_tokens'] = self.generation_config['max_output_tokens']
+        return options
+
+    def generate(self, prompt):
+        response = self._client.chat.completions.create(
+            model=self.model_name, messages=self._messages(prompt), **self._options())
+        choice = response.choices[0]
+        result = ModelResponse(choice.message.content, _openai_finish_reason(choice.finish_reason),
+                               *self._usage(response.usage))
+        self.usage.record(result)
+        return result
+
+    def stream(self, prompt):
+        """
+        Yields the response as ModelResponse chunks while it is generated; the last chunk carries the
+        finish reason and token counts.
+        """
+        response = self._client.chat.completions.create(
+            model=self.model_name, messages=self._messages(prompt), stream=True,
+            stream_options={'include_usage': True}, **self._options())
+        for chunk in response:
+            choice = chunk.choices[0] if chunk.choices else None
+            result = ModelResponse((choice.delta.content or '') if choice else '',
+                                   _openai_finish_reason(choice.finish_reason) if choice else None,
+                                   *self._usage(getattr(chunk, 'usage', None)))
+            if result.input_tokens is not None:
+                # Only the final chunk carries the usage of the whole response
+                self.usage.record(result)
+            yield result
+
+    def close(self):
+        self._client.close()
+
+
+def _openai_finish_reason(finish_reason):
+    # Report truncation the same way as Gemini so parse_response handles both
+    return 'MAX_TOKENS' if finish_reason == 'length' else finish_reason
+
+
+class MockBackend:
+    """
+    Deterministic local stand-in for a model, for benchmarks and dry runs without the live service.
+
+    Responses are replayed from a recordings file (see RecordingBackend) or, for prompts that were not
+    recorded, built by synthesize(prompt) -> response text. Every call sleeps for latency seconds plus up to
+    latency_jitter seconds, fails with a transport error with probability error_rate (or a quota error with
+    probability quota_error_rate), and is cut in half and reported as truncated with probability
+    truncation_rate. The random draws depend only on the seed, the prompt and how often the prompt was sent
+    before, so runs are repeatable with any number of workers.
+    stream() spreads the latency over chunks of stream_chunk_size characters.
+    Token counts are estimated locally. The system_instruction is counted as input of every call, and as
+    cached input when context_cache_ttl is set, to mirror the accounting of the real services.
+    """
+
+    name = 'mock'
+
+    def __init__(self, synthesize=None, recordings=None, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 truncation_rate=0.0, seed=0, model_name='mock', generation_config=None, stream_chunk_size=256,
+                 system_instruction=None, context_cache_ttl=None, quota_error_rate=0.0):
+        self.synthesize = synthesize
+        self.recordings = load_recordings(recordings) if isinstance(recordings, str) else dict(recordings or {})
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.truncation_rate = truncation_rate
+        self.quota_error_rate = quota_error_rate
+        self.seed = seed
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+        self.stream_chunk_size = stream_chunk_size
+        self.system_instruction = system_instruction
+        self.context_cache_ttl = context_cache_ttl
+        self.usage = TokenUsage()
+        self.calls = 0
+        self._attempts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        delay, response = self._respond(prompt)
+        if delay > 0:
+            time.sleep(delay)
+        self.usage.record(response)
+        return response
+
+    def stream(self, prompt):
+        delay, response = self._respond(prompt)
+        text = response.text or ''
+        chunk_size = self.stream_chunk_size
+        chunk_count = max(1, -(-len(text) // chunk_size))
+        for start in range(0, chunk_count * chunk_size, chunk_size):
+            if delay > 0:
+                time.sleep(delay / chunk_count)
+            last = start + chunk_size >= len(text)
+            if last:
+                self.usage.record(response)
+                yield response._replace(text=text[start:])
+            else:
+                yield ModelResponse(text[start:start + chunk_size], None, None, None)
+
+    def close(self):
+        pass
+
+    def _respond(self, prompt):
+        """
+        Returns (latency, response) for one call; raises the simulated errors.
+        """
+        key = prompt_key(prompt, self.system_instruction)
+        with self._lock:
+            attempt = self._attempts[key]
+            self._attempts[key] += 1
+            self.calls += 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+
+        delay = self.latency + rng.uniform(0, self.latency_jitter)
+        if rng.random() < self.error_rate:
+            if delay > 0:
+                time.sleep(delay)
+            raise ConnectionError("Mock backend: simulated transport error.")
+        if rng.random() < self.quota_error_rate:
+            if delay > 0:
+                time.sleep(delay)
+            raise RuntimeError("Mock backend: simulated 429 quota exceeded.")
+
+        recorded = self.recordings.get(key)
+        if recorded is not None:
+            text, finish_reason = recorded['text'], recorded.get('finish_reason')
+        elif self.synthesize is not None:
+            text, finish_reason = self.synthesize(prompt), 'STOP'
+        else:
+            raise LookupError("Mock backend: no recorded response for this prompt.")
+
+        if text and rng.random() < self.truncation_rate:
+            text, finish_reason = text[:len(text) // 2], 'MAX_TOKENS'
+        instruction_tokens = estimate_tokens(self.system_instruction) if self.system_instruction else 0
+        return delay, ModelResponse(text, finish_reason, estimate_tokens(prompt) + instruction_tokens,
+                                    estimate_tokens(text or ''),
+                                    instruction_tokens if self.context_cache_ttl else 0)
+
+
+class RecordingBackend:
+    """
+    Wraps another backend and appends every response to a JSONL recordings file that MockBackend can replay.
+    """
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self.name = backend.name
+        self.model_name = backend.model_name
+        self.generation_config = backend.generation_config
+        self.system_instruction = getattr(backend, 'system_instruction', None)
+        self.usage = backend.usage
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        response = self.backend.generate(prompt)
+        self._record(prompt, response.text, response.finish_reason)
+        return response
+
+    def stream(self, prompt):
+        chunks = []
+        finish_reason = None
+        for chunk in self.backend.stream(prompt):
+            chunks.append(chunk.text or '')
+            finish_reason = chunk.finish_reason or finish_reason
+            yield chunk
+        self._record(prompt, ''.join(chunks), finish_reason)
+
+    def close(self):
+        self.backend.close()
+
+    def _record(self, prompt, text, finish_reason):
+        record = {'key': prompt_key(prompt, self.system_instruction), 'model': self.model_name, 'text': text,
+                  'finish_reason': finish_reason}
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def load_recordings(path):
+    """
+    Returns {prompt key: record} from a recordings file; later records of the same prompt win.
+    """
+    recordings = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                recordings[record['key']] = record
+    return recordings
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'openai': OpenAIBackend,
+    'mock': MockBackend,
+}
+
+
+def create_backend(name, **options):
+    """
+    Creates the backend registered under name ('gemini', 'openai' or 'mock') with the given options.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown model backend {name!r}; expected one of {sorted(BACKENDS)}.") from None
+    return backend_class(**options)
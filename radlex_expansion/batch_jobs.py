@@ -0,0 +1,112 @@
+import dataclasses
+import json
+import os
+
+# Batch request files are split into shards of at most this many requests
+DEFAULT_SHARD_SIZE = 10000
+
+
+def make_custom_id(prefix, group_index, content_hash):
+    """
+    Returns the stable custom ID of a group's request, e.g. 'unit_parsing-g0000012-3f9a1c0b2d4e5f60'.
+    """
+    return f"{prefix}-g{group_index:07d}-{content_hash}"
+
+
+def _request_body(prompt, generation_config, safety_settings):
+    """
+    Builds a generateContent request body for a batch job.
+    """
+    if dataclasses.is_dataclass(generation_config):
+        generation_config = dataclasses.asdict(generation_config)
+    body = {
+        'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+        'generation_config': {key: value for key, value in dict(generation_config).items() if value is not None},
+    }
+    if safety_settings:
+        body['safety_settings'] = [{'category': getattr(category, 'name', str(category)),
+                                    'threshold': getattr(threshold, 'name', str(threshold))}
+                                   for category, threshold in safety_settings.items()]
+    return body
+
+
+def write_batch_requests(batch_dir, requests, generation_config, safety_settings=None,
+                         shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Writes batch requests to sharded requests-NNNNN.jsonl files in batch_dir, one JSON line per group:
+    {"key": <custom id>, "request": <generateContent body>}.
+    requests yields (custom_id, prompt, group_record) tuples; every group_record is saved with its custom ID
+    in groups.jsonl so the results can be mapped back to their groups when they are ingested.
+    Returns the paths of the written shards.
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    shard_paths = []
+    shard = None
+    with open(os.path.join(batch_dir, 'groups.jsonl'), 'w', encoding='utf-8') as groups_file:
+        for request_count, (custom_id, prompt, group_record) in enumerate(requests):
+            if request_count % shard_size == 0:
+                if shard is not None:
+                    shard.close()
+                shard_paths.append(os.path.join(batch_dir, f"requests-{len(shard_paths):05d}.jsonl"))
+                shard = open(shard_paths[-1], 'w', encoding='utf-8')
+            line = {'key': custom_id, 'request': _request_body(prompt, generation_config, safety_settings)}
+            shard.write(json.dumps(line, ensure_ascii=False) + '\n')
+            groups_file.write(json.dumps(dict(group_record, key=custom_id), ensure_ascii=False) + '\n')
+    if shard is not None:
+        shard.close()
+    return shard_paths
+
+
+def load_batch_groups(batch_dir):
+    """
+    Returns {custom_id: group_record} for the groups written by write_batch_requests.
+    """
+    groups = {}
+    with open(os.path.join(batch_dir, 'groups.jsonl'), encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                groups[record['key']] = record
+    return groups
+
+
+def _response_text(response):
+    """
+    Extracts (text, finish_reason) from a Gemini generateContent response or an OpenAI chat completion body.
+    """
+    if 'candidates' in response:
+        candidates = response['candidates']
+        if not candidates:
+            return None, None
+        candidate = candidates[0]
+        parts = candidate.get('content', {}).get('parts', [])
+        text = ''.join(part.get('text', '') for part in parts if not part.get('thought'))
+        return text, candidate.get('finishReason') or candidate.get('finish_reason')
+    body = response.get('body', response)
+    if 'choices' in body:
+        choice = body['choices'][0]
+        finish_reason = choice.get('finish_reason')
+        return choice['message'].get('content'), 'MAX_TOKENS' if finish_reason == 'length' else finish_reason
+    return None, None
+
+
+def read_batch_results(results_file):
+    """
+    Streams (custom_id, response_text, finish_reason, error) from a batch results JSONL file.
+    Lines use the Gemini batch format ({"key", "response"} or {"key", "error"}) or the OpenAI batch format
+    ({"custom_id", "response": {"body"}}); error is None for successful lines.
+    """
+    with open(results_file, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            custom_id = result.get('key') or result.get('custom_id')
+            if result.get('error'):
+                yield custom_id, None, None, result['error']
+                continue
+            text, finish_reason = _response_text(result.get('response') or {})
+            if text is None:
+                yield custom_id, None, finish_reason, 'Response did not contain any text.'
+            else:
+                yield custom_id, text, finish_reason, None
@@ -0,0 +1,102 @@
+import re
+import threading
+
+from .dispatch import estimate_tokens
+
+
+class TruncatedResponseError(ValueError):
+    """
+    Raised when a model response was cut off by the output token limit.
+    partial_results holds the items that were complete before the cut, keyed by their position in the request.
+    """
+
+    def __init__(self, message, partial_results=None):
+        super().__init__(message)
+        self.partial_results = partial_results or {}
+
+
+def looks_truncated(response_text):
+    """
+    Returns True if a response ends inside an unfinished JSON object or array.
+    """
+    # Braces inside strings are rare in these responses, so counting outside of strings is not needed
+    text = re.sub(r'"(?:\\.|[^"\\])*"', '""', response_text)
+    return text.count('{') > text.count('}') or text.count('[') > text.count(']')
+
+
+class BatchPlanner:
+    """
+    Packs items into groups that fit a token budget instead of a fixed number of items per group.
+
+    The input tokens of each item are estimated locally. The output tokens of a group are estimated
+    with a ratio of output to input tokens that is calibrated from successful responses, and a group is
+    closed before its estimated output would exceed output_margin of max_output_tokens.
+    When a response is truncated, the maximum group size is halved and the output ratio raised, so later
+    groups are packed smaller; after enough successes the group size grows back towards max_items.
+    """
+
+    def __init__(self, max_items, target_input_tokens=None, max_output_tokens=None,
+                 output_ratio=4.0, output_margin=0.75, min_items=1):
+        self.max_items_ceiling = max_items
+        self.max_items = max_items
+        self.target_input_tokens = target_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.output_ratio = output_ratio
+        self.output_margin = output_margin
+        self.min_items = min_items
+        self._successes_since_change = 0
+        self._lock = threading.Lock()
+
+    def _fits(self, item_count, input_tokens):
+        if item_count > self.max_items:
+            return False
+        if self.target_input_tokens and input_tokens > self.target_input_tokens:
+            return False
+        if self.max_output_tokens and input_tokens * self.output_ratio > self.max_output_tokens * self.output_margin:
+            return False
+        return True
+
+    def plan(self, items):
+        """
+        Lazily packs (item_id, text) pairs into groups and yields each group as a list of item ids.
+        Feedback recorded while groups are in flight applies to the groups planned after it.
+        """
+        group = []
+        group_tokens = 0
+        for item_id, text in items:
+            tokens = estimate_tokens(str(text))
+            with self._lock:
+                fits = self._fits(len(group) + 1, group_tokens + tokens)
+            if group and not fits:
+                yield group
+                group = []
+                group_tokens = 0
+            group.append(item_id)
+            group_tokens += tokens
+        if group:
+            yield group
+
+    def record_success(self, input_tokens, output_tokens):
+        """
+        Calibrates the output ratio from a complete response and slowly grows the group size back.
+        """
+        with self._lock:
+            if input_tokens > 0:
+                self.output_ratio = 0.8 * self.output_ratio + 0.2 * (output_tokens / input_tokens)
+            self._successes_since_change += 1
+            if self._successes_since_change >= 10 and self.max_items < self.max_items_ceiling:
+                self.max_items += 1
+                self._successes_since_change = 0
+
+    def record_truncation(self, group_size):
+        """
+        Shrinks later groups after a response of a group with group_size items was truncated.
+        A single item that does not fit the output limit says nothing about the group size, so it is ignored;
+        otherwise later groups hold at most half of the failing group (rounded up), or fewer if already smaller.
+        """
+        if group_size <= 1:
+            return
+        with self._lock:
+            self.max_items = max(self.min_items, min(self.max_items, (group_size + 1) // 2))
+            self.output_ratio *= 1.5
+            self._successes_since_change = 0
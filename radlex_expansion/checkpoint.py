@@ -0,0 +1,326 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+
+# Excel worksheets hold at most this many rows (including the header row)
+EXCEL_MAX_ROWS = 1048576
+
+
+def _atomic_replace(tmp_path, path):
+    """
+    Moves a fully written temporary file into place so readers never see a partial file.
+    """
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_table_rows(path):
+    """
+    Streams rows as dicts from an existing .xlsx, .csv or .parquet table.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    elif extension == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    else:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                rows = worksheet.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    continue
+                for values in rows:
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+
+
+def group_hash(group):
+    """
+    Returns a short, stable hash of the items in a group.
+    """
+    content = '\x1f'.join(str(item) for item in group)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+class ProgressManifest:
+    """
+    Durable record of finished groups, keyed by group index and group content hash.
+    Each finished group is appended as one JSON line, and the latest line for a group wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A torn final line from an interrupted write
+                    self.entries[entry['group_index']] = entry
+
+    def next_group_index(self):
+        """
+        Returns the first group index not used by any recorded group.
+        """
+        return max(self.entries, default=-1) + 1
+
+    def prepare_resume(self, items):
+        """
+        Compares the recorded groups with the current items and returns the ids of items that finished
+        successfully; every other item (never sent, or listed in a group's failed_items) is sent again.
+        Groups whose items no longer hash to the recorded value (the input changed) are marked superseded,
+        which leaves their rows out of the export and sends their items again.
+        """
+        completed_items = set()
+        superseded = []
+        for group_index, entry in sorted(self.entries.items()):
+            item_ids = entry.get('items')
+            if entry['status'] == 'superseded' or item_ids is None:
+                continue
+            if (any(item_id >= len(items) for item_id in item_ids)
+                    or group_hash([items[item_id] for item_id in item_ids]) != entry['group_hash']):
+                superseded.append(dict(entry, status='superseded', shard=None))
+            else:
+                completed_items.update(set(item_ids) - set(entry.get('failed_items', ())))
+        if superseded:
+            self.record(superseded)
+        return completed_items
+
+    def item_owners(self):
+        """
+        Returns {item_id: group_index} of the latest group that attempted each item.
+        Rows an older group wrote for the same item (such as error rows) are superseded by that group's rows.
+        """
+        owners = {}
+        for group_index, entry in sorted(self.entries.items()):
+            if entry['status'] != 'superseded':
+                for item_id in entry.get('items') or ():
+                    owners[item_id] = group_index
+        return owners
+
+    def record(self, entries):
+        """
+        Appends entries (dicts with group_index, group_hash, status, shard, items and failed_items)
+        and syncs them to disk.
+        """
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self.entries[entry['group_index']] = entry
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class CheckpointStore:
+    """
+    Append-only checkpoint of result rows.
+    Every flush writes one new JSONL shard with an atomic rename, so the cost of a checkpoint
+    depends only on the rows being flushed, never on the rows already written.
+    The final table is built once at the end with export().
+
+    Rows may carry a '_group' key. The manifest records which shard holds the latest attempt of each
+    group and item, so rows from superseded attempts (e.g. an item that failed and was re-run in a later
+    group) are left out of the export.
+
+    Rows may also carry an '_item' key naming a deduplicated input item. On export such rows are fanned out
+    to every input row recorded for the item with record_occurrences(), filling the 'Row Index' column.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = ProgressManifest(os.path.join(directory, 'manifest.jsonl'))
+        # Shards are numbered in the order they are written; the directory is only listed once
+        shards = self.shards()
+        self._next_shard = int(os.path.basename(shards[-1])[6:-6]) + 1 if shards else 0
+
+    @classmethod
+    def for_output(cls, output_file, checkpoint_dir=None, overwrite=False):
+        """
+        Opens the store for an output file (default directory: "<output_file>.checkpoint").
+        An existing output file without a checkpoint (e.g. written before checkpoints were sharded) cannot be
+        matched to the groups that produced it, so every item would be sent again and written twice; it is
+        refused with FileExistsError unless overwrite is set, in which case the export replaces it.
+        """
+        store = cls(checkpoint_dir or f"{output_file}.checkpoint")
+        if os.path.exists(output_file) and not store.shards() and not store.manifest.entries and not overwrite:
+            raise FileExistsError(
+                f"{output_file} exists but has no checkpoint in {store.directory}, so its rows cannot be resumed "
+                f"from. Move it away, or set overwrite_output = True to replace it with the output of this run.")
+        return store
+
+    def shards(self):
+        """
+        Returns the shard paths in the order they were written.
+        """
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith('shard-') and name.endswith('.jsonl'))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def append(self, rows, groups=()):
+        """
+        Writes rows as a new shard and returns its path.
+        groups lists (group_index, group_hash, item_ids, failed_item_ids) for every group whose results are in
+        this flush; they are recorded in the manifest only after the shard is safely on disk.
+        """
+        path = os.path.join(self.directory, f"shard-{self._next_shard:06d}.jsonl")
+        self._next_shard += 1
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        _atomic_replace(tmp_path, path)
+
+        shard_name = os.path.basename(path)
+        self.manifest.record({'group_index': group_index, 'group_hash': content_hash,
+                              'status': 'failed' if failed_item_ids else 'ok', 'shard': shard_name,
+                              'items': item_ids, 'failed_items': failed_item_ids}
+                             for group_index, content_hash, item_ids, failed_item_ids in groups)
+        return path
+
+    def record_occurrences(self, occurrences):
+        """
+        Records which input rows each deduplicated item stands for (occurrences[item] lists row indices).
+        """
+        path = os.path.join(self.directory, 'occurrences.jsonl')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item, rows in enumerate(occurrences):
+                f.write(json.dumps({'item': item, 'rows': rows}) + '\n')
+        _atomic_replace(tmp_path, path)
+
+    def load_occurrences(self):
+        """
+        Returns the recorded {item: [row indices]} mapping, or an empty dict if none was recorded.
+        """
+        path = os.path.join(self.directory, 'occurrences.jsonl')
+        occurrences = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    occurrences[entry['item']] = entry['rows']
+        return occurrences
+
+    def iter_rows(self):
+        """
+        Streams the checkpointed rows of the latest attempt of every group and item, in the order they were written.
+        """
+        item_owners = self.manifest.item_owners()
+        for shard in self.shards():
+            shard_name = os.path.basename(shard)
+            with open(shard, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    group_index = row.get('_group')
+                    entry = self.manifest.entries.get(group_index)
+                    if entry is not None and entry['shard'] != shard_name:
+                        continue
+                    if item_owners.get(row.get('_item'), group_index) != group_index:
+                        continue
+                    yield row
+
+    def iter_output_rows(self):
+        """
+        Streams the rows of iter_rows(), fanning deduplicated items out to every input row they stand for.
+        The rows of an item are repeated together for each of its input rows, so the output of one input row
+        stays contiguous.
+        """
+        occurrences = self.load_occurrences()
+        for item, item_rows in itertools.groupby(self.iter_rows(), key=lambda row: row.get('_item')):
+            row_indices = occurrences.get(item)
+            if not row_indices:
+                yield from item_rows
+                continue
+            item_rows = list(item_rows)
+            for row_index in row_indices:
+                for row in item_rows:
+                    yield dict(row, **{'Row Index': row_index})
+
+    def export(self, output_file, columns, integer_columns=()):
+        """
+        Streams all checkpointed rows into the final .xlsx, .csv or .parquet file.
+        """
+        write_table(output_file, self.iter_output_rows(), columns, integer_columns)
+
+
+def write_table(path, rows, columns, integer_columns=()):
+    """
+    Streams rows (dicts) into an .xlsx, .csv or .parquet file, replacing it atomically.
+    In Parquet files, integer_columns are stored as 64-bit integers and all other columns as strings.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    root = os.path.splitext(path)[0]
+    tmp_path = f"{root}.tmp{extension}"
+
+    if extension == '.csv':
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+    elif extension == '.parquet':
+        _write_parquet(tmp_path, rows, columns, integer_columns)
+    else:
+        _write_excel(tmp_path, rows, columns)
+
+    _atomic_replace(tmp_path, path)
+
+
+def _write_excel(path, rows, columns):
+    """
+    Writes rows with openpyxl's write-only mode, starting a new sheet whenever one is full.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = None
+    sheet_rows = EXCEL_MAX_ROWS
+    for row in rows:
+        if sheet_rows >= EXCEL_MAX_ROWS:
+            worksheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+            worksheet.append(columns)
+            sheet_rows = 1
+        worksheet.append([row.get(column) for column in columns])
+        sheet_rows += 1
+    if worksheet is None:
+        workbook.create_sheet('Sheet1').append(columns)
+    workbook.save(path)
+
+
+def _write_parquet(path, rows, columns, integer_columns=(), batch_size=50000):
+    """
+    Writes rows to a Parquet file in fixed-size record batches.
+    The schema is fixed by the columns up front rather than inferred from the first batch, where a column
+    that happens to be empty would be typed as null and a stray value type would fail the later batches.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    integer_columns = set(integer_columns)
+    schema = pa.schema([(column, pa.int64() if column in integer_columns else pa.string()) for column in columns])
+    converters = [int if column in integer_columns else str for column in columns]
+
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append({column: None if row.get(column) is None else convert(row.get(column))
+                          for column, convert in zip(columns, converters)})
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
@@ -0,0 +1,171 @@
+"""
+Command-line entry point for the RadLex expansion pipelines.
+
+Settings are read from a TOML config file with one table per module ([unit_parsing], [radlex_synonym],
+[pipeline], [radlex_index]) holding any of the settings at the top of that module, and can be overridden
+on the command line:
+
+    python -m radlex_expansion --config radlex.toml unit-parsing --input reports.xlsx --output units.csv
+    python -m radlex_expansion radlex-synonym --input radlex.xlsx --output synonyms.csv --run-mode batch-write
+    python -m radlex_expansion --config radlex.toml pipeline --backend mock --set max_workers=16
+
+The pipeline modules, and with them the model SDKs, are imported only for the command that runs.
+"""
+import argparse
+import importlib
+import sys
+import tomllib
+import types
+
+# Command: (module of the radlex_expansion package, input path setting, output path setting, description)
+COMMANDS = {
+    'unit-parsing': ('unit_parsing', 'input_file', 'output_file',
+                     "Split reports into lexicon units with their categories."),
+    'radlex-synonym': ('radlex_synonym', 'radlex_file', 'output_file',
+                       "Generate synonyms of RadLex preferred labels."),
+    'pipeline': ('pipeline', 'input_file', 'mapped_output_file',
+                 "Parse reports into units and map them to RadLex terms (uses the [unit_parsing] settings too)."),
+    'build-index': ('radlex_index', 'radlex_output_file', 'index_file',
+                    "Build the RadLex lookup index from radlex-synonym output."),
+}
+
+# Commands that can write and ingest batch jobs instead of sending requests themselves
+RUN_MODE_COMMANDS = {'unit-parsing', 'radlex-synonym'}
+
+
+def is_placeholder(value):
+    """
+    Returns True for the '####' placeholders that stand for unset paths and keys.
+    """
+    return isinstance(value, str) and bool(value) and set(value) == {'#'}
+
+
+def parse_value(text):
+    """
+    Parses a --set value as a TOML value, falling back to the plain string.
+    """
+    try:
+        return tomllib.loads(f"value = {text}")['value']
+    except tomllib.TOMLDecodeError:
+        return text
+
+
+def setting_table(module):
+    """
+    Returns the config file table of a module: its name without the package.
+    """
+    return module.__name__.rpartition('.')[2]
+
+
+def apply_settings(module, settings, source):
+    """
+    Overrides the module-level settings of module; unknown names raise ValueError.
+    """
+    for name, value in settings.items():
+        current = getattr(module, name, None)
+        if (name.startswith('_') or not hasattr(module, name) or callable(current)
+                or isinstance(current, types.ModuleType)):
+            raise ValueError(f"{source}: {setting_table(module)} has no setting {name!r}.")
+        setattr(module, name, value)
+
+
+def setting_value(modules, name):
+    """
+    Returns a setting as the command's run sees it: the pipeline's input and output files default (None) to
+    those of unit_parsing.
+    """
+    for module in reversed(modules):
+        if getattr(module, name, None) is not None:
+            return getattr(module, name)
+    return None
+
+
+def required_settings(module, input_setting, output_setting):
+    """
+    Returns the path settings the module's run needs in its run mode.
+    """
+    run_mode = getattr(module, 'run_mode', 'sync')
+    if run_mode == 'batch-ingest':
+        required = [output_setting, 'batch_dir', 'batch_results_file']
+    elif run_mode == 'batch-write':
+        required = [input_setting, output_setting, 'batch_dir']
+    else:
+        required = [input_setting, output_setting]
+    if setting_table(module) == 'pipeline':
+        required += ['output_file', 'radlex_synonym_file']
+    return required
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='radlex-expansion', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-c', '--config', help="TOML config file")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+    for command, (_, _, _, description) in COMMANDS.items():
+        subparser = commands.add_parser(command, help=description, description=description)
+        subparser.add_argument('--input', help="input file")
+        subparser.add_argument('--output', help="output file")
+        if command in RUN_MODE_COMMANDS:
+            subparser.add_argument('--run-mode', choices=['sync', 'batch-write', 'batch-ingest'],
+                                   help="send requests (sync), or write or ingest a batch job")
+        subparser.add_argument('--backend', choices=['gemini', 'openai', 'mock'], help="model backend")
+        subparser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                               help="override a setting; VALUE is read as a TOML value, else as a string")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    module_name, input_setting, output_setting, _ = COMMANDS[args.command]
+
+    config = {}
+    if args.config:
+        with open(args.config, 'rb') as f:
+            config = tomllib.load(f)
+
+    module = importlib.import_module(f"radlex_expansion.{module_name}")
+    # The pipeline runs unit parsing with that module's settings
+    modules = ([importlib.import_module('radlex_expansion.unit_parsing'), module] if module_name == 'pipeline'
+               else [module])
+
+    overrides = {}
+    if args.input:
+        overrides[input_setting] = args.input
+    if args.output:
+        overrides[output_setting] = args.output
+    if getattr(args, 'run_mode', None):
+        overrides['run_mode'] = args.run_mode
+    for assignment in args.set:
+        name, separator, value = assignment.partition('=')
+        if not separator:
+            parser.error(f"--set expects NAME=VALUE, got {assignment!r}.")
+        overrides[name.strip()] = parse_value(value.strip())
+    if 'run_mode' in overrides and args.command not in RUN_MODE_COMMANDS:
+        parser.error(f"{args.command} has no batch run mode; run_mode cannot be set.")
+    try:
+        for target in modules:
+            apply_settings(target, config.get(setting_table(target), {}), args.config)
+        if args.backend:
+            overrides['backend_name'] = args.backend
+        for name, value in overrides.items():
+            # Settings the pipeline module does not have are unit_parsing settings
+            target = next((target for target in reversed(modules) if hasattr(target, name)), module)
+            apply_settings(target, {name: value}, 'command line')
+    except ValueError as e:
+        parser.error(str(e))
+
+    for name in required_settings(module, input_setting, output_setting):
+        value = setting_value(modules, name)
+        if value is None or is_placeholder(value):
+            parser.error(f"{module_name}.{name} is not set; give it in the config file or on the command line.")
+    for target in modules:
+        # Without a configured key, the SDKs read their own environment variables (GOOGLE_API_KEY, OPENAI_API_KEY)
+        if is_placeholder(getattr(target, 'api_key', None)):
+            target.api_key = None
+
+    module.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import re
+
+
+def normalize_text(text):
+    """
+    Normalizes a string for duplicate matching: collapses whitespace and ignores case.
+    """
+    return re.sub(r'\s+', ' ', str(text)).strip().casefold()
+
+
+def deduplicate(items, normalize=False):
+    """
+    Collapses duplicate items before they are sent to the model.
+    Returns (unique_items, occurrences), where occurrences[i] lists the original positions of unique_items[i].
+    The first occurrence of each item is kept as its representative.
+    With normalize=True, items that differ only in whitespace or case are treated as duplicates.
+    """
+    unique_items = []
+    occurrences = []
+    positions_by_key = {}
+    for position, item in enumerate(items):
+        key = normalize_text(item) if normalize else item
+        unique_position = positions_by_key.get(key)
+        if unique_position is None:
+            unique_position = positions_by_key[key] = len(unique_items)
+            unique_items.append(item)
+            occurrences.append([])
+        occurrences[unique_position].append(position)
+    return unique_items, occurrences
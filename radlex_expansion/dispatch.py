@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Result of one dispatched group, yielded in group order
+GroupOutcome = namedtuple('GroupOutcome', ['group_index', 'group', 'result', 'queue_wait', 'elapsed'])
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimates the number of tokens in a text (about four characters per token).
+    """
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests-per-minute and tokens-per-minute quotas.
+    A single instance is shared by all worker threads so that their combined rate stays under the quota.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(float(self.requests_per_minute),
+                                          self._request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until a request carrying the given number of tokens fits in both quotas.
+        Returns the number of seconds spent waiting.
+        """
+        start = time.monotonic()
+        if self.tokens_per_minute:
+            # A single request larger than the whole bucket would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._request_allowance < 1:
+                    wait = max(wait, (1 - self._request_allowance) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._token_allowance < tokens:
+                    wait = max(wait, (tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+
+                if wait == 0:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return time.monotonic() - start
+            time.sleep(wait)
+
+
+def dispatch_groups(groups, worker, max_workers=1, max_pending=None):
+    """
+    Runs worker(group, group_index) over (group_index, group) pairs, keeping up to max_workers groups in flight.
+    Outcomes are yielded in group order even though groups finish out of order.
+    """
+    def run(group_index, group, submitted_time):
+        start_time = time.time()
+        result = worker(group, group_index)
+        return GroupOutcome(group_index, group, result, start_time - submitted_time, time.time() - start_time)
+
+    if max_workers <= 1:
+        for group_index, group in groups:
+            yield run(group_index, group, time.time())
+        return
+
+    # Bound the number of submitted groups so a slow group cannot make the backlog grow without limit
+    max_pending = max_pending or max_workers * 4
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for group_index, group in groups:
+                pending.append(executor.submit(run, group_index, group, time.time()))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,126 @@
+import json
+import random
+import time
+
+from .batch_planner import TruncatedResponseError
+
+# Exception class names (from the Gemini and OpenAI SDKs) that identify each error class
+QUOTA_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests', 'RateLimitError'}
+SAFETY_ERROR_NAMES = {'BlockedPromptException', 'StopCandidateException'}
+TRANSPORT_ERROR_NAMES = {'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError', 'ServerError',
+                         'GatewayTimeout', 'BadGateway', 'RetryError', 'APIConnectionError', 'APITimeoutError'}
+
+# How each error class is handled: (max attempts, or None for max_retries; back off between attempts;
+# bisect the group when attempts run out)
+RETRY_POLICY = {
+    'quota': (None, True, False),
+    'transport': (None, True, False),
+    'other': (3, True, True),
+    'malformed': (2, False, True),
+    'safety': (1, False, True),
+    'truncated': (1, False, True),
+}
+
+
+class MalformedResponseError(ValueError):
+    """
+    Raised when a response is not valid JSON or does not have the expected structure.
+    """
+
+
+def classify_error(error):
+    """
+    Classifies an exception raised while requesting a group as quota, safety, truncated, malformed,
+    transport or other.
+    """
+    names = {cls.__name__ for cls in type(error).__mro__}
+    message = str(error).lower()
+    if isinstance(error, TruncatedResponseError):
+        return 'truncated'
+    if names & QUOTA_ERROR_NAMES or '429' in message or 'quota' in message or 'rate limit' in message:
+        return 'quota'
+    if names & SAFETY_ERROR_NAMES or 'safety' in message or 'blocked' in message:
+        return 'safety'
+    if isinstance(error, (MalformedResponseError, json.JSONDecodeError)):
+        return 'malformed'
+    if names & TRANSPORT_ERROR_NAMES or isinstance(error, (ConnectionError, TimeoutError)):
+        return 'transport'
+    return 'other'
+
+
+def backoff_delay(attempt, base_delay, max_delay=120):
+    """
+    Returns an exponential backoff delay with jitter for the given (1-based) failed attempt.
+    """
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def isolate_failures(group, request, group_index, max_retries=10, base_delay=2, on_error=None):
+    """
+    Runs request(items) -> {position within items: result} over a group and returns (results, failed_positions),
+    with results keyed by position within the group.
+
+    Items that come back valid are kept, and only the missing ones are requested again; this includes the items
+    that were complete before a truncated response was cut off. Errors are classified and retried according to
+    RETRY_POLICY; a sub-group that keeps failing for a reason that may be caused by one of its items
+    (malformed JSON, safety block, truncation) is split in half until the bad items are isolated.
+    on_error(error_class, item_count) is called for every failed attempt.
+    """
+    results = {}
+    failed_positions = []
+    pending = [list(range(len(group)))]
+
+    while pending:
+        positions = pending.pop()
+        attempts = 0
+        bisect = True
+        while positions:
+            try:
+                returned = request([group[position] for position in positions])
+                if not returned:
+                    raise MalformedResponseError("Response did not contain any valid items.")
+            except Exception as e:
+                error_class = classify_error(e)
+                if on_error is not None:
+                    on_error(error_class, len(positions))
+                returned = getattr(e, 'partial_results', None)
+                if returned:
+                    # A truncated response still made progress; keep its complete items without using an attempt
+                    print(f"Group {group_index}: response truncated after {len(returned)} of "
+                          f"{len(positions)} items.")
+                else:
+                    attempts += 1
+                    max_attempts, back_off, bisect = RETRY_POLICY[error_class]
+                    print(f"Error processing group {group_index} ({error_class}, {len(positions)} items), "
+                          f"attempt {attempts}: {e}")
+                    if attempts < (max_attempts or max_retries):
+                        if back_off:
+                            delay = backoff_delay(attempts, base_delay)
+                            print(f"Retrying in {delay:.1f} seconds...")
+                            time.sleep(delay)
+                        continue
+                    break
+
+            # Keep the items that came back and request only the missing ones again
+            for local_position, result in returned.items():
+                results[positions[local_position]] = result
+            positions = [position for local_position, position in enumerate(positions)
+                         if local_position not in returned]
+            if positions:
+                print(f"Group {group_index}: re-requesting {len(positions)} missing items...")
+
+        if not positions:
+            continue
+        if bisect and len(positions) > 1:
+            middle = len(positions) // 2
+            print(f"Group {group_index}: splitting {len(positions)} failing items into "
+                  f"{middle} and {len(positions) - middle}...")
+            pending.append(positions[middle:])
+            pending.append(positions[:middle])
+        else:
+            failed_positions.extend(positions)
+
+    if failed_positions:
+        print(f"Failed to process {len(failed_positions)} of {len(group)} items in group {group_index}.")
+    return results, sorted(failed_positions)
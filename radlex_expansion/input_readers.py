@@ -0,0 +1,95 @@
+import csv
+import json
+import os
+
+# Input formats by file extension
+INPUT_FORMATS = {'.xlsx': 'excel', '.xlsm': 'excel', '.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+                 '.parquet': 'parquet'}
+
+
+def input_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in INPUT_FORMATS:
+        raise ValueError(f"Unsupported input file type '{extension}' (expected one of {sorted(INPUT_FORMATS)}).")
+    return INPUT_FORMATS[extension]
+
+
+def _cell_text(value):
+    # Empty cells read as empty strings, everything else as its text
+    return '' if value is None else str(value)
+
+
+def _select(header, column):
+    """
+    Returns the position of column (a header name or a 0-based position) in a header row.
+    """
+    if isinstance(column, int):
+        return column
+    if header is None or column not in header:
+        raise ValueError(f"Column '{column}' not found in the input header {list(header or [])}.")
+    return list(header).index(column)
+
+
+def _iter_excel(path, column, header, sheet_name):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams the rows from the file instead of loading the whole workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        position = _select(next(rows, None), column) if header else column
+        for row in rows:
+            yield _cell_text(row[position] if position < len(row) else None)
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path, column, header):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = csv.reader(f)
+        position = _select(next(rows, None), column) if header else column
+        for row in rows:
+            yield _cell_text(row[position] if position < len(row) else None)
+
+
+def _iter_jsonl(path, column):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = record.get(column) if isinstance(column, str) else list(record.values())[column]
+            elif isinstance(record, list):
+                record = record[column] if isinstance(column, int) else None
+            yield _cell_text(record)
+
+
+def _iter_parquet(path, column, batch_size):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    name = parquet_file.schema_arrow.names[column] if isinstance(column, int) else column
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[name]):
+        for value in batch.column(0).to_pylist():
+            yield _cell_text(value)
+
+
+def iter_input_column(path, column=0, header=True, sheet_name=None, batch_size=10000):
+    """
+    Streams the values of one input column as strings from an .xlsx, .csv, .jsonl or .parquet file, so that
+    the file is never loaded as a whole.
+
+    column is a header name or a 0-based position; header=False reads a file without a header row (Excel and
+    CSV only). sheet_name selects an Excel worksheet (default: the first). JSONL lines are objects keyed by
+    column name, lists, or bare values. Parquet files are read batch_size rows at a time.
+    """
+    file_format = input_format(path)
+    if file_format == 'excel':
+        return _iter_excel(path, column, header, sheet_name)
+    if file_format == 'csv':
+        return _iter_csv(path, column, header)
+    if file_format == 'jsonl':
+        return _iter_jsonl(path, column)
+    return _iter_parquet(path, column, batch_size)
@@ -0,0 +1,285 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class GroupMetrics:
+    """
+    Measurements of one group, filled in by the worker thread that processes it.
+    """
+
+    def __init__(self, group_index, items):
+        self.group_index = group_index
+        self.items = items
+        self.api_calls = 0
+        self.api_latency = 0.0
+        self.quota_wait = 0.0
+        self.parse_time = 0.0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.retries = Counter()
+
+    def record_call(self, latency, response=None):
+        """
+        Records one API call and the token counts of its response (a ModelResponse or its final chunk).
+        """
+        self.api_calls += 1
+        self.api_latency += latency
+        if response is not None:
+            self.record_tokens(response)
+
+    def record_tokens(self, response):
+        self.input_tokens += response.input_tokens or 0
+        self.cached_tokens += response.cached_tokens or 0
+        self.output_tokens += response.output_tokens or 0
+
+    def track_stream(self, chunks):
+        """
+        Passes streamed chunks through and records the token counts carried by the final chunk.
+        """
+        for chunk in chunks:
+            if chunk.input_tokens is not None:
+                self.record_tokens(chunk)
+            yield chunk
+
+    def record_retry(self, error_class):
+        self.retries[error_class] += 1
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus exposition format.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+
+    def render(self, name, labels):
+        lines = [f"# TYPE {name} histogram"]
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Instrumentation:
+    """
+    Collects per-group performance measurements of a run and exports them.
+
+    Every finished group, checkpoint and export is written as one JSON line to event_log (if given).
+    Aggregated metrics are written in the Prometheus text format to metrics_file (for the node exporter's
+    textfile collector) and/or served at http://<metrics_host>:metrics_port/metrics; the server listens on the
+    loopback interface unless metrics_host says otherwise. A throughput and ETA summary is printed at most
+    every progress_interval seconds.
+    """
+
+    def __init__(self, pipeline, total_items, event_log=None, metrics_file=None, metrics_port=None,
+                 progress_interval=10.0, metrics_host='127.0.0.1'):
+        self.pipeline = pipeline
+        self.total_items = total_items
+        self.metrics_file = metrics_file
+        self.progress_interval = progress_interval
+        self.start_time = time.time()
+        self.groups = Counter()  # groups by status: ok, partial (some items failed), failed
+        self.items = Counter()  # items by status: ok, failed
+        self.retries = Counter()  # failed attempts by error class
+        self.tokens = Counter()  # input, cached and output tokens
+        self.checkpoint_time = 0.0
+        self.export_time = 0.0
+        self.histograms = {name: Histogram() for name in
+                           ('queue_wait', 'quota_wait', 'api_latency', 'parse_time', 'group_latency')}
+        self._active = {}
+        self._last_progress = self.start_time
+        self._lock = threading.Lock()
+        self._event_log = open(event_log, 'a', encoding='utf-8') if event_log else None
+        self._server = None
+        if metrics_port:
+            self._serve(metrics_host, metrics_port)
+        self.event('run_start', total_items=total_items)
+
+    def event(self, event, **fields):
+        """
+        Appends one event to the event log.
+        """
+        if self._event_log is None:
+            return
+        line = json.dumps(dict(event=event, pipeline=self.pipeline, time=round(time.time(), 3), **fields))
+        with self._lock:
+            self._event_log.write(line + '\n')
+            self._event_log.flush()
+
+    def start_group(self, group_index, items):
+        """
+        Returns the GroupMetrics to fill in while the group is processed.
+        """
+        metrics = GroupMetrics(group_index, items)
+        with self._lock:
+            self._active[group_index] = metrics
+        return metrics
+
+    def finish_group(self, group_index, queue_wait, elapsed, failed_items):
+        """
+        Records a group after it was processed (in group order) and prints the progress summary when due.
+        """
+        with self._lock:
+            metrics = self._active.pop(group_index)
+            status = 'ok' if not failed_items else 'failed' if failed_items == metrics.items else 'partial'
+            self.groups[status] += 1
+            self.items['ok'] += metrics.items - failed_items
+            self.items['failed'] += failed_items
+            self.retries.update(metrics.retries)
+            self.tokens.update(input=metrics.input_tokens, cached=metrics.cached_tokens,
+                               output=metrics.output_tokens)
+            for name, value in (('queue_wait', queue_wait), ('quota_wait', metrics.quota_wait),
+                                ('api_latency', metrics.api_latency), ('parse_time', metrics.parse_time),
+                                ('group_latency', elapsed)):
+                self.histograms[name].observe(value)
+        self.event('group', group_index=group_index, status=status, items=metrics.items,
+                   failed_items=failed_items, queue_wait=round(queue_wait, 4), elapsed=round(elapsed, 4),
+                   api_calls=metrics.api_calls, api_latency=round(metrics.api_latency, 4),
+                   quota_wait=round(metrics.quota_wait, 4), parse_time=round(metrics.parse_time, 4),
+                   cache_hits=metrics.cache_hits, retries=dict(metrics.retries), input_tokens=metrics.input_tokens,
+                   cached_tokens=metrics.cached_tokens, output_tokens=metrics.output_tokens)
+
+        if time.time() - self._last_progress >= self.progress_interval:
+            self.report_progress()
+
+    def record_checkpoint(self, group_indices, rows, seconds):
+        """
+        Records the time spent checkpointing the rows of a batch of groups.
+        """
+        with self._lock:
+            self.checkpoint_time += seconds
+        self.event('checkpoint', groups=list(group_indices), rows=rows, seconds=round(seconds, 4))
+
+    def record_export(self, output_file, seconds):
+        """
+        Records the time spent writing the final output file, which is kept apart from checkpoint time.
+        """
+        with self._lock:
+            self.export_time += seconds
+        self.event('export', output_file=output_file, seconds=round(seconds, 4))
+
+    def progress(self):
+        """
+        Returns processed items, items per second and the estimated seconds left (None before any progress).
+        """
+        elapsed = time.time() - self.start_time
+        processed = self.items['ok'] + self.items['failed']
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        eta = (self.total_items - processed) / rate if rate > 0 else None
+        return processed, rate, eta
+
+    def report_progress(self):
+        processed, rate, eta = self.progress()
+        self._last_progress = time.time()
+        retries = ', '.join(f"{error_class} {count}" for error_class, count in sorted(self.retries.items()))
+        eta_text = f"{eta / 60:.1f} min" if eta is not None else "unknown"
+        print(f"Progress: {processed}/{self.total_items} items, {sum(self.groups.values())} groups, "
+              f"{rate:.1f} items/s, ETA {eta_text}; retries: {retries or 'none'}; "
+              f"checkpoint time {self.checkpoint_time:.1f} s.")
+        self.write_metrics()
+
+    def render_metrics(self):
+        """
+        Returns the current metrics in the Prometheus text exposition format.
+        """
+        prefix = 'radlex_pipeline'
+        pipeline = f'pipeline="{self.pipeline}"'
+        processed, rate, eta = self.progress()
+        with self._lock:
+            lines = [f"# TYPE {prefix}_groups_total counter"]
+            lines += [f'{prefix}_groups_total{{{pipeline},status="{status}"}} {count}'
+                      for status, count in sorted(self.groups.items())]
+            lines.append(f"# TYPE {prefix}_items_total counter")
+            lines += [f'{prefix}_items_total{{{pipeline},status="{status}"}} {count}'
+                      for status, count in sorted(self.items.items())]
+            lines.append(f"# TYPE {prefix}_retries_total counter")
+            lines += [f'{prefix}_retries_total{{{pipeline},error_class="{error_class}"}} {count}'
+                      for error_class, count in sorted(self.retries.items())]
+            lines.append(f"# TYPE {prefix}_tokens_total counter")
+            lines += [f'{prefix}_tokens_total{{{pipeline},kind="{kind}"}} {count}'
+                      for kind, count in sorted(self.tokens.items())]
+            lines.append(f"# TYPE {prefix}_checkpoint_seconds_total counter")
+            lines.append(f"{prefix}_checkpoint_seconds_total{{{pipeline}}} {self.checkpoint_time:.6f}")
+            lines.append(f"# TYPE {prefix}_export_seconds_total counter")
+            lines.append(f"{prefix}_export_seconds_total{{{pipeline}}} {self.export_time:.6f}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines += histogram.render(f"{prefix}_{name}_seconds", pipeline)
+        lines.append(f"# TYPE {prefix}_items_per_second gauge")
+        lines.append(f"{prefix}_items_per_second{{{pipeline}}} {rate:.6f}")
+        lines.append(f"# TYPE {prefix}_remaining_items gauge")
+        lines.append(f"{prefix}_remaining_items{{{pipeline}}} {self.total_items - processed}")
+        if eta is not None:
+            lines.append(f"# TYPE {prefix}_eta_seconds gauge")
+            lines.append(f"{prefix}_eta_seconds{{{pipeline}}} {eta:.1f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self):
+        """
+        Atomically rewrites the metrics textfile, if one is configured.
+        """
+        if not self.metrics_file:
+            return
+        tmp_path = f"{self.metrics_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_metrics())
+        os.replace(tmp_path, self.metrics_file)
+
+    def _serve(self, host, port):
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = instrumentation.render_metrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics.")
+
+    def close(self):
+        """
+        Prints the final summary, writes the final metrics and closes the event log and metrics server.
+        """
+        self.report_progress()
+        self.event('run_end', elapsed=round(time.time() - self.start_time, 3), groups=dict(self.groups),
+                   items=dict(self.items), retries=dict(self.retries), tokens=dict(self.tokens),
+                   checkpoint_time=round(self.checkpoint_time, 4), export_time=round(self.export_time, 4))
+        if self._event_log is not None:
+            self._event_log.close()
+            self._event_log = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,197 @@
+import json
+import re
+import time
+
+from .backend_pool import BackendPool, PoolMember, served_by, tag_backend
+from .backends import MockBackend, ModelResponse, create_backend
+from .batch_planner import TruncatedResponseError, looks_truncated
+from .dispatch import estimate_tokens
+from .failure_isolation import MalformedResponseError, isolate_failures
+from .response_cache import ResponseCache
+from .stream_parser import stream_items
+
+
+def parse_response(response_text, finish_reason, response_key, index=None):
+    """
+    Parses the text of a model response into the list under response_key ('reports' or 'term_and_synonyms').
+    Raises TruncatedResponseError for a response cut off by the output token limit, with the items that were
+    complete before the cut indexed by index(items, False) when index is given, and MalformedResponseError
+    for a response without the expected JSON structure.
+    """
+    # A response cut off by the output token limit would be cut off again, so only its complete items are kept
+    cut_off = getattr(finish_reason, 'name', finish_reason) == 'MAX_TOKENS'
+    if cut_off or (response_text and looks_truncated(response_text)):
+        items, complete = stream_items([ModelResponse(response_text or '', finish_reason, None, None)], response_key)
+        if complete:
+            return items
+        raise TruncatedResponseError(
+            "Response reached the output token limit." if cut_off
+            else "Response ends inside an unfinished JSON object.",
+            index(items, False) if index is not None else None)
+
+    # Validate if the response is empty
+    if not response_text:
+        raise MalformedResponseError("Received an empty response from the API.")
+
+    # Parse the JSON response content
+    response_json = response_text
+
+    # Remove comments or non-JSON parts using regular expressions
+    # This will match and extract the JSON part within the response
+    json_match = re.search(r"\{.*\}", response_json, re.DOTALL)
+
+    if json_match:
+        # Extract the JSON part
+        response_json = json_match.group(0)
+        response_data = json.loads(response_json)  # Parsing the string as JSON
+    else:
+        raise MalformedResponseError("No valid JSON object found in the response.")
+
+    # Validate response structure
+    if not isinstance(response_data.get(response_key), list):
+        raise MalformedResponseError(f"Invalid response format: '{response_key}' key not found.")
+    return response_data[response_key]
+
+
+def create_model_backend(name, settings, **options):
+    """
+    Creates a model backend from the model settings of a pipeline module (a dict with system_instruction,
+    context_cache_ttl, synthesize, model_name, api_key, generation_config and safety_settings); options
+    override them. The mock backend synthesizes valid responses unless it is given recordings to replay.
+    """
+    if settings['system_instruction']:
+        options.setdefault('system_instruction', settings['system_instruction'])
+        if name != 'openai':
+            options.setdefault('context_cache_ttl', settings['context_cache_ttl'])
+    if name == 'mock':
+        options.setdefault('synthesize', settings['synthesize'])
+        options.setdefault('generation_config', settings['generation_config'])
+        return MockBackend(**options)
+    options.setdefault('model_name', settings['model_name'])
+    options.setdefault('api_key', settings['api_key'])
+    options.setdefault('generation_config', settings['generation_config'])
+    if name == 'gemini':
+        options.setdefault('safety_settings', settings['safety_settings'])
+    return create_backend(name, **options)
+
+
+def create_model_pool(members, create_member, default_backend, **options):
+    """
+    Creates a BackendPool from backend_pool-style member settings, creating each member's backend with
+    create_member(name, **settings); a member without 'backend' uses default_backend. options apply to every member.
+    """
+    pool_members = []
+    for settings in members:
+        settings = dict(settings, **options)
+        name = settings.pop('backend', default_backend)
+        limits = {key: settings.pop(key) for key in ('label', 'requests_per_minute', 'tokens_per_minute')
+                  if key in settings}
+        pool_members.append(PoolMember(create_member(name, **settings), **limits))
+    return BackendPool(pool_members)
+
+
+def request_group(prompt, item_prompt, response_key, index, item_count, backend, rate_limiter=None,
+                  response_cache=None, streaming=False, metrics=None, cache_lookup=True):
+    """
+    Sends one request for a group and returns its valid items keyed by their position in the group.
+    prompt is the full prompt and item_prompt its per-call part, sent alone when the backend holds the
+    instructions; index(items, complete) maps the parsed items under response_key to their positions among
+    the item_count items of the request.
+    Raises on any API, truncation or parsing error; retries are handled by process_group.
+    When a rate limiter is given, the request waits for quota before it is sent.
+    When a response cache is given, a previously parsed response for the same prompt is returned without an API call
+    (unless cache_lookup is False, as for a retry). Only responses with a valid item for every position are cached,
+    so an incomplete or unusable response is never replayed in place of asking the model again.
+    If the response is cut off, the items that were already complete are raised with the TruncatedResponseError
+    (indexed with complete=False) so that only the rest are requested again; with streaming, the response is
+    parsed while it arrives.
+    API latency, quota wait, parse time and tokens are added to metrics (a GroupMetrics) when it is given;
+    with streaming, parsing overlaps the response and counts as API latency.
+    Each item records the backend that produced it under 'backend' (see backend_pool.served_by).
+    """
+    cache_key = None
+    if response_cache is not None:
+        cache_key = ResponseCache.make_key(prompt, backend.model_name, backend.generation_config)
+        cached = response_cache.get(cache_key) if cache_lookup else None
+        if cached is not None:
+            indexed = index(cached, True)
+            if len(indexed) == item_count:
+                if metrics is not None:
+                    metrics.cache_hits += 1
+                return indexed
+
+    # Send the API request; the quota also counts the instructions when they are sent separately
+    if rate_limiter is not None:
+        quota_wait = rate_limiter.acquire(estimate_tokens(prompt))
+        if metrics is not None:
+            metrics.quota_wait += quota_wait
+    if backend.system_instruction:
+        prompt = item_prompt
+
+    call_start = time.time()
+    try:
+        if streaming:
+            chunks = backend.stream(prompt)
+            if metrics is not None:
+                chunks = metrics.track_stream(chunks)
+            items, complete = stream_items(chunks, response_key)
+        else:
+            response = backend.generate(prompt)
+            if metrics is not None:
+                metrics.record_tokens(response)
+    finally:
+        if metrics is not None:
+            metrics.record_call(time.time() - call_start)
+
+    parse_start = time.time()
+    backend_label = served_by(backend)
+    if streaming:
+        tag_backend(items, backend_label)
+        if not complete:
+            raise TruncatedResponseError(f"Streamed response was cut off before the end of '{response_key}'.",
+                                         index(items, False))
+    else:
+        try:
+            items = parse_response(response.text, response.finish_reason, response_key, index)
+        except TruncatedResponseError as e:
+            tag_backend(e.partial_results.values(), backend_label)
+            raise
+        tag_backend(items, backend_label)
+    indexed = index(items, True)
+    if response_cache is not None and len(indexed) == item_count:
+        response_cache.put(cache_key, items)
+    if metrics is not None:
+        metrics.parse_time += time.time() - parse_start
+    return indexed
+
+
+def process_group(group, group_index, request, planner=None, metrics=None, max_retries=10, retry_delay=2):
+    """
+    Processes a single group with request(items, cache_lookup) (a request_group call for a part of the group)
+    and returns (items keyed by position within the group, failed positions). A retry of the same items skips
+    the response cache.
+    Items that parsed correctly are kept and only the missing ones are requested again; errors are retried
+    with backoff where that helps, and a group that keeps failing is bisected to isolate the bad items.
+    A truncated response also makes the planner pack later groups smaller.
+    Failed attempts are counted by error class in metrics (a GroupMetrics) when it is given.
+    """
+    requested = set()
+
+    def attempt(items):
+        key = tuple(str(item) for item in items)
+        cache_lookup = key not in requested
+        requested.add(key)
+        indexed = request(items, cache_lookup)
+        if planner is not None and indexed:
+            planner.record_success(sum(estimate_tokens(str(items[position])) for position in indexed),
+                                   estimate_tokens(json.dumps(list(indexed.values()))))
+        return indexed
+
+    def on_error(error_class, item_count):
+        if metrics is not None:
+            metrics.record_retry(error_class)
+        if error_class == 'truncated' and planner is not None:
+            planner.record_truncation(item_count)
+
+    return isolate_failures(group, attempt, group_index, max_retries=max_retries, base_delay=retry_delay,
+                            on_error=on_error)
@@ -0,0 +1,207 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from . import unit_parsing
+from .checkpoint import CheckpointStore, write_table
+from .radlex_index import RadLexIndex, build_index, fold_variant
+
+# Define file paths
+input_file = None  # Reports, as read by unit_parsing.read_reports (default: unit_parsing.input_file)
+output_file = None  # Parsed units (default: unit_parsing.output_file)
+mapped_output_file = '####'  # Parsed units with their RadLex terms
+radlex_synonym_file = '###'  # radlex_synonym output the RadLex index is built from
+radlex_index_file = 'radlex_index.bin'
+
+# Stage settings: processes that map units to RadLex, distinct units per mapping task, and how many groups of
+# parsed rows and mapping tasks may wait between stages before the stage feeding them is held back
+mapping_processes = 4
+mapping_chunk_size = 5000
+row_queue_size = 64
+max_pending_tasks = 8
+
+# Columns of the mapped output file
+MAPPED_COLUMNS = unit_parsing.OUTPUT_COLUMNS + ['RadLex Term', 'RadLex Category']
+MAPPED_INTEGER_COLUMNS = unit_parsing.INTEGER_COLUMNS + ['RadLex Category']
+
+# RadLex index of a mapping process, opened once by its initializer
+_process_index = None
+
+
+def _open_index(index_file):
+    global _process_index
+    _process_index = RadLexIndex(index_file)
+
+
+def _map_units(keys):
+    """
+    Looks up folded units in the RadLex index of this mapping process.
+    """
+    return _process_index.lookup_many(keys)
+
+
+def ensure_index(radlex_synonym_file, radlex_index_file):
+    """
+    Builds the RadLex index unless it exists and is newer than the radlex_synonym output.
+    """
+    if os.path.exists(radlex_index_file) and (
+            not os.path.exists(radlex_synonym_file)
+            or os.path.getmtime(radlex_index_file) >= os.path.getmtime(radlex_synonym_file)):
+        return
+    build_index(radlex_synonym_file, radlex_index_file)
+
+
+class UnitMapper:
+    """
+    Normalization and mapping stages of the pipeline.
+
+    consume() runs in its own thread: it folds the units of parsed rows taken from a queue, drops the ones
+    already seen, and sends the new ones in chunks to a process pool that looks them up in the RadLex index.
+    At most max_pending_tasks chunks are in flight; when that many are waiting, consume() waits for the
+    oldest one, so the queue in front of it fills up and parsing is held back in turn.
+    """
+
+    def __init__(self, index_file, processes=4, chunk_size=5000, max_pending_tasks=8):
+        self.chunk_size = chunk_size
+        self.max_pending_tasks = max_pending_tasks
+        self.mappings = {}  # folded unit -> RadLexMatch, or None if it has no RadLex term
+        self.units = 0
+        self.error = None
+        self._seen = set()
+        self._chunk = []
+        self._pending = deque()
+        # Worker processes are spawned rather than forked, since the parsing stage runs threads
+        self._executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_open_index, initargs=(index_file,))
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.units += 1
+            key = fold_variant(row['Unit'])
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self._chunk.append(key)
+            if len(self._chunk) >= self.chunk_size:
+                self._submit()
+
+    def _submit(self):
+        while len(self._pending) >= self.max_pending_tasks:
+            self._collect()
+        self._pending.append((self._chunk, self._executor.submit(_map_units, self._chunk)))
+        self._chunk = []
+
+    def _collect(self):
+        keys, future = self._pending.popleft()
+        self.mappings.update(zip(keys, future.result()))
+
+    def consume(self, row_queue):
+        """
+        Maps the rows put on row_queue until it yields None. An error is kept in self.error, and the queue
+        is still drained so that the parsing stage is never blocked on it.
+        """
+        while True:
+            rows = row_queue.get()
+            if rows is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.add_rows(rows)
+            except Exception as e:
+                self.error = e
+        try:
+            if self._chunk:
+                self._submit()
+            while self._pending:
+                self._collect()
+        except Exception as e:
+            self.error = self.error or e
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def export_mapped(output_file, mapped_output_file, mappings, radlex_index_file, checkpoint_dir=None):
+    """
+    Streams the parsed units of output_file's checkpoint store into mapped_output_file with their RadLex term
+    and category. Units that were parsed in an earlier run and are not in mappings yet are looked up here.
+    Returns the number of rows and of rows with a RadLex term.
+    """
+    # The parsing stage has just exported output_file from this store
+    store = CheckpointStore.for_output(output_file, checkpoint_dir, overwrite=True)
+    counts = {'rows': 0, 'mapped': 0}
+
+    def mapped_rows(index):
+        for row in store.iter_output_rows():
+            key = fold_variant(row['Unit'])
+            if key not in mappings:
+                mappings[key] = index.lookup(key)
+            match = mappings[key]
+            counts['rows'] += 1
+            if match is not None:
+                counts['mapped'] += 1
+                row = dict(row, **{'RadLex Term': match.term, 'RadLex Category': match.category})
+            yield row
+
+    with RadLexIndex(radlex_index_file) as index:
+        write_table(mapped_output_file, mapped_rows(index), MAPPED_COLUMNS, MAPPED_INTEGER_COLUMNS)
+    return counts['rows'], counts['mapped']
+
+
+def run_pipeline(input_file, output_file, mapped_output_file, radlex_synonym_file, radlex_index_file,
+                 mapping_processes=4, mapping_chunk_size=5000, row_queue_size=64, max_pending_tasks=8,
+                 **report_options):
+    """
+    Parses the reports of input_file into units (unit_parsing.process_reports with report_options, written to
+    output_file) and maps every unit to its RadLex term, writing both to mapped_output_file.
+
+    The stages overlap: while groups wait for the model, the rows of finished groups are normalized and
+    deduplicated in a separate thread and looked up in the RadLex index by a pool of mapping_processes
+    processes. Queues between the stages are bounded by row_queue_size groups and max_pending_tasks chunks,
+    so a stage that falls behind holds back the ones before it instead of letting memory grow.
+    Returns the process_reports summary with the mapping counts added.
+    """
+    start_time = time.time()
+    ensure_index(radlex_synonym_file, radlex_index_file)
+
+    mapper = UnitMapper(radlex_index_file, mapping_processes, mapping_chunk_size, max_pending_tasks)
+    row_queue = queue.Queue(maxsize=row_queue_size)
+    mapping_thread = threading.Thread(target=mapper.consume, args=(row_queue,), daemon=True)
+    mapping_thread.start()
+    try:
+        summary = unit_parsing.process_reports(input_file, output_file, on_rows=row_queue.put, **report_options)
+    finally:
+        row_queue.put(None)
+        mapping_thread.join()
+        mapper.close()
+    if mapper.error is not None:
+        raise mapper.error
+
+    print(f"Mapped {len(mapper.mappings)} distinct units of {mapper.units} parsed units while parsing.")
+    print(f"Exporting mapped units to {mapped_output_file}...")
+    rows, mapped = export_mapped(output_file, mapped_output_file, mapper.mappings, radlex_index_file,
+                                 report_options.get('checkpoint_dir'))
+    print(f"{mapped} of {rows} units have a RadLex term. "
+          f"Total elapsed time: {time.time() - start_time:.2f} seconds.")
+    return dict(summary, mapped_rows=mapped, rows=rows)
+
+
+def run():
+    """
+    Runs the pipeline with the settings above and the unit_parsing settings.
+    """
+    return run_pipeline(input_file or unit_parsing.input_file, output_file or unit_parsing.output_file,
+                        mapped_output_file, radlex_synonym_file, radlex_index_file,
+                        mapping_processes=mapping_processes, mapping_chunk_size=mapping_chunk_size,
+                        row_queue_size=row_queue_size, max_pending_tasks=max_pending_tasks,
+                        **unit_parsing.report_options())
+
+
+# Run the pipeline
+if __name__ == '__main__':
+    run()
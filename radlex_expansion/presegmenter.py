@@ -0,0 +1,179 @@
+import re
+from collections import Counter, namedtuple
+
+from .checkpoint import read_table_rows
+
+# Words are separated by whitespace and hyphens, so "ground-glass opacity" also matches "ground glass opacity"
+TOKEN_PATTERN = re.compile(r'[^\s\-]+')
+
+# Connecting words that are dropped between units, as the model does ("consolidation in lower lobe")
+SKIP_WORDS = frozenset({'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with',
+                        'within'})
+
+# One piece of a segmented report: a known unit with its category, or an unresolved span (category None)
+Segment = namedtuple('Segment', ['text', 'category'])
+
+# Key of the value stored at the trie node where a phrase ends
+_END = ''
+
+
+def fold_tokens(text):
+    """
+    Returns the matching keys of the words in text: case-folded, split on whitespace and hyphens.
+    """
+    return [match.group().casefold() for match in TOKEN_PATTERN.finditer(str(text))]
+
+
+class LexiconSegmenter:
+    """
+    Word-level trie of known lexicon units that segments report strings by greedy longest match.
+
+    Each report is scanned left to right; at every word the longest known unit starting there is taken.
+    Words that do not start a known unit become unresolved spans, except connecting words (SKIP_WORDS)
+    between units, which are dropped.
+    """
+
+    def __init__(self, skip_words=SKIP_WORDS):
+        self.skip_words = skip_words
+        self.size = 0
+        self._root = {}
+
+    def __len__(self):
+        return self.size
+
+    def add(self, phrase, category):
+        """
+        Adds a unit with its category. Returns False if the phrase (after folding) was already known,
+        in which case the existing category is kept.
+        """
+        keys = fold_tokens(phrase)
+        if not keys:
+            return False
+        node = self._root
+        for key in keys:
+            node = node.setdefault(key, {})
+        if _END in node:
+            return False
+        node[_END] = (' '.join(str(phrase).split()), category)
+        self.size += 1
+        return True
+
+    def lookup(self, phrase):
+        """
+        Returns (unit, category) for a known phrase, or None.
+        """
+        node = self._root
+        for key in fold_tokens(phrase):
+            node = node.get(key)
+            if node is None:
+                return None
+        return node.get(_END)
+
+    def _longest_match(self, keys, start):
+        node = self._root
+        match = None
+        for position in range(start, len(keys)):
+            node = node.get(keys[position])
+            if node is None:
+                break
+            if _END in node:
+                match = (position + 1, node[_END])
+        return match
+
+    def segment(self, text):
+        """
+        Splits text into a list of Segments: known units in their stored spelling and unresolved spans
+        as they appear in text.
+        """
+        text = str(text)
+        words = list(TOKEN_PATTERN.finditer(text))
+        keys = [word.group().casefold() for word in words]
+        segments = []
+        span_start = None
+
+        def close_span(end):
+            # Connecting words at the end of a span belong between it and the next unit
+            while end > span_start and keys[end - 1] in self.skip_words:
+                end -= 1
+            if end > span_start:
+                segments.append(Segment(text[words[span_start].start():words[end - 1].end()], None))
+
+        position = 0
+        while position < len(keys):
+            match = self._longest_match(keys, position)
+            if match is not None:
+                if span_start is not None:
+                    close_span(position)
+                    span_start = None
+                end, (unit, category) = match
+                segments.append(Segment(unit, category))
+                position = end
+                continue
+            if span_start is None and keys[position] not in self.skip_words:
+                span_start = position
+            position += 1
+        if span_start is not None:
+            close_span(len(keys))
+        return segments
+
+
+def is_covered(segments):
+    """
+    Returns True if a segmented report consists only of known units.
+    """
+    return bool(segments) and all(segment.category is not None for segment in segments)
+
+
+def build_segmenter(unit_files=(), radlex_files=(), min_count=2):
+    """
+    Builds a segmenter from earlier outputs.
+
+    unit_files are unit_parsing outputs (Unit and Category columns); a unit is added when the model produced it
+    for at least min_count reports, with its most frequent category. Reports are told apart by Group Index and
+    Report Index, since the rows of a duplicate report are repeated for every Row Index it appears in.
+    radlex_files are radlex_synonym outputs (term and pipe-separated category_1..category_4 columns); the label
+    and all synonyms of a term are added with the category of whichever of them is already known as a unit,
+    since RadLex itself has no unit categories.
+    """
+    segmenter = LexiconSegmenter()
+    counts = Counter()
+    for path in unit_files:
+        counted = set()
+        for row_number, row in enumerate(read_table_rows(path)):
+            unit, category = row.get('Unit'), row.get('Category')
+            try:
+                category = int(category)
+            except (TypeError, ValueError):
+                continue
+            # Units that were segmented locally are not evidence from the model
+            if not unit or not str(unit).strip() or row.get('Backend') == 'local':
+                continue
+            report = (row.get('Group Index'), row.get('Report Index'))
+            if report == (None, None):
+                report = row_number  # An output without the index columns
+            key = (str(unit).strip(), category)
+            if (key, report) not in counted:
+                counted.add((key, report))
+                counts[key] += 1
+    # The most frequent spelling and category of each unit is added first and wins
+    for (unit, category), count in counts.most_common():
+        if count >= min_count:
+            segmenter.add(unit, category)
+    unit_count = len(segmenter)
+
+    for path in radlex_files:
+        for row in read_table_rows(path):
+            term = row.get('term')
+            if not term or term == 'error':
+                continue
+            variants = [term]
+            for number in range(1, 5):
+                variants.extend(variant for variant in str(row.get(f'category_{number}') or '').split('|')
+                                if variant.strip())
+            known = next((match for match in map(segmenter.lookup, variants) if match is not None), None)
+            if known is not None:
+                for variant in variants:
+                    segmenter.add(variant, known[1])
+
+    print(f"Pre-segmenter: {unit_count} known units and {len(segmenter) - unit_count} RadLex variants.")
+    return segmenter
@@ -0,0 +1,216 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from .checkpoint import read_table_rows
+
+# Define file paths
+radlex_output_file = '###'  # Output of radlex_synonym.py (.xlsx, .csv or .parquet)
+index_file = 'radlex_index.bin'
+
+# Header: magic, byte order, variant count, term count, key blob size, term blob size
+MAGIC = b'RADLEXI1'
+HEADER = struct.Struct('<8s8sIIII')
+
+# Source column of a variant: the RadLex term itself, or one of the synonym categories of radlex_synonym
+SOURCES = ('term', 'category_1', 'category_2', 'category_3', 'category_4')
+
+# The term a variant maps to and the column it came from (0 for the term itself, 1-4 for category_1..4)
+RadLexMatch = namedtuple('RadLexMatch', ['term', 'category'])
+
+_SEPARATORS = re.compile(r'[\s\-\u2010-\u2015_]+')
+
+
+def fold_variant(text):
+    """
+    Returns the lookup key of a variant: Unicode-normalized, case-folded, with hyphens, underscores and runs
+    of whitespace folded into single spaces ("Ground-Glass  opacity" -> "ground glass opacity").
+    """
+    text = unicodedata.normalize('NFKC', str(text))
+    return _SEPARATORS.sub(' ', text).strip().casefold()
+
+
+def _key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _layout(variant_count, term_count, key_blob_size):
+    """
+    Returns the offsets of the sections that follow the header, each aligned to 8 bytes.
+    """
+    hashes = _align(HEADER.size)
+    key_offsets = hashes + 8 * variant_count
+    term_ids = _align(key_offsets + 4 * (variant_count + 1))
+    categories = term_ids + 4 * variant_count
+    term_offsets = _align(categories + variant_count)
+    key_blob = term_offsets + 4 * (term_count + 1)
+    term_blob = key_blob + key_blob_size
+    return hashes, key_offsets, term_ids, categories, term_offsets, key_blob, term_blob
+
+
+def build_index(radlex_files, index_file):
+    """
+    Compiles radlex_synonym outputs into a lookup index file mapping every folded variant (the term and the
+    pipe-separated synonyms of category_1..category_4) to its RadLex term and category.
+    A variant listed for several terms keeps all of them; the same variant of one term keeps its lowest category.
+    Returns the number of variants and terms.
+    """
+    if isinstance(radlex_files, str):
+        radlex_files = [radlex_files]
+    term_ids = {}
+    variants = {}  # (folded key, term id) -> category
+    for path in radlex_files:
+        for row in read_table_rows(path):
+            term = row.get('term')
+            if not term or term == 'error':
+                continue
+            term = str(term).strip()
+            term_id = term_ids.setdefault(term, len(term_ids))
+            for category, source in enumerate(SOURCES):
+                values = [term] if category == 0 else str(row.get(source) or '').split('|')
+                for value in values:
+                    key = fold_variant(value)
+                    if key and variants.get((key, term_id), category + 1) > category:
+                        variants[(key, term_id)] = category
+
+    entries = sorted((_key_hash(key.encode('utf-8')), category, term_id, key.encode('utf-8'))
+                     for (key, term_id), category in variants.items())
+    terms = sorted(term_ids, key=term_ids.get)
+
+    hashes = array('Q', (entry[0] for entry in entries))
+    categories = array('B', (entry[1] for entry in entries))
+    entry_terms = array('I', (entry[2] for entry in entries))
+    key_offsets = array('I', [0])
+    for entry in entries:
+        key_offsets.append(key_offsets[-1] + len(entry[3]))
+    term_offsets = array('I', [0])
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    for encoded in encoded_terms:
+        term_offsets.append(term_offsets[-1] + len(encoded))
+
+    sections = zip(_layout(len(entries), len(terms), key_offsets[-1]),
+                   (hashes, key_offsets, entry_terms, categories, term_offsets,
+                    b''.join(entry[3] for entry in entries), b''.join(encoded_terms)))
+    tmp_path = f"{index_file}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder.encode('ascii'), len(entries), len(terms), key_offsets[-1],
+                            term_offsets[-1]))
+        for offset, data in sections:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(data if isinstance(data, bytes) else data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_file)
+    print(f"Built RadLex index with {len(entries)} variants of {len(terms)} terms in {index_file}.")
+    return len(entries), len(terms)
+
+
+class RadLexIndex:
+    """
+    Read-only, memory-mapped variant -> RadLex term index written by build_index.
+
+    Lookups binary-search a sorted table of 64-bit key hashes and confirm the key bytes, so opening the
+    index reads nothing up front and processes that open the same file share its pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byteorder, self.variant_count, self.term_count, key_blob_size, _ = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a RadLex index.")
+        if byteorder.rstrip(b'\0').decode('ascii') != sys.byteorder:
+            self._mmap.close()
+            raise ValueError(f"{path} was built on a machine with a different byte order; rebuild it.")
+
+        view = memoryview(self._mmap)
+        hashes, key_offsets, term_ids, categories, term_offsets, key_blob, term_blob = _layout(
+            self.variant_count, self.term_count, key_blob_size)
+        count = self.variant_count
+        self._hashes = view[hashes:hashes + 8 * count].cast('Q')
+        self._key_offsets = view[key_offsets:key_offsets + 4 * (count + 1)].cast('I')
+        self._term_ids = view[term_ids:term_ids + 4 * count].cast('I')
+        self._categories = view[categories:categories + count]
+        self._term_offsets = view[term_offsets:term_offsets + 4 * (self.term_count + 1)].cast('I')
+        self._key_blob = view[key_blob:term_blob]
+        self._term_blob = view[term_blob:]
+        self._views = [view, self._hashes, self._key_offsets, self._term_ids, self._categories,
+                       self._term_offsets, self._key_blob, self._term_blob]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.variant_count
+
+    def _term(self, term_id):
+        return bytes(self._term_blob[self._term_offsets[term_id]:self._term_offsets[term_id + 1]]).decode('utf-8')
+
+    def lookup_all(self, text):
+        """
+        Returns every RadLexMatch of a variant, best (lowest category) first; empty if it is unknown.
+        """
+        key = fold_variant(text).encode('utf-8')
+        if not key:
+            return []
+        key_hash = _key_hash(key)
+        matches = []
+        position = bisect_left(self._hashes, key_hash)
+        while position < self.variant_count and self._hashes[position] == key_hash:
+            if self._key_blob[self._key_offsets[position]:self._key_offsets[position + 1]] == key:
+                matches.append(RadLexMatch(self._term(self._term_ids[position]), self._categories[position]))
+            position += 1
+        return matches
+
+    def lookup(self, text):
+        """
+        Returns the best RadLexMatch of a variant, or None if it is unknown.
+        """
+        matches = self.lookup_all(text)
+        return matches[0] if matches else None
+
+    def lookup_many(self, texts):
+        """
+        Returns the best RadLexMatch (or None) of each text; repeated texts are looked up once.
+        """
+        found = {}
+        results = []
+        for text in texts:
+            if text not in found:
+                found[text] = self.lookup(text)
+            results.append(found[text])
+        return results
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+def run():
+    """
+    Builds the index with the settings above.
+    """
+    return build_index(radlex_output_file, index_file)
+
+
+# Build the index
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,410 @@
+import json
+
+from . import model_requests
+from .batch_planner import BatchPlanner
+from .dedup import deduplicate, normalize_text
+from .input_readers import iter_input_column
+from .runner import ingest_batch, open_checkpoint, run_groups, write_batch
+
+# Model backend: 'gemini', 'openai' or 'mock' (a local stand-in that synthesizes responses, see backends.py)
+backend_name = 'gemini'
+api_key = "####"
+model_name = "gemini-2.0-flash-thinking-exp-01-21"
+generation_config = {'temperature': 0.0, 'max_output_tokens': 8192}
+
+# Backend pool: credential/model pairs to spread groups across instead of the single backend above
+# (entries as for unit_parsing.backend_pool)
+backend_pool = None
+SAFETY_SETTINGS = {
+    'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
+    'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
+    'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE',
+    'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE'
+}
+
+# Columns of the output file
+OUTPUT_COLUMNS = ['Row Index', 'term', 'category_1', 'category_2', 'category_3', 'category_4', 'Backend']
+INTEGER_COLUMNS = ['Row Index']
+
+# Placeholder result written for a term that failed after all retries
+ERROR_RESULT = {"term": "error", "category_1": "error", "category_2": "error",
+                "category_3": "error", "category_4": "error"}
+
+# Static instructions shared by every request; sent once as a system instruction or cached context
+# when use_system_instruction is set, and in front of the items otherwise
+SYSTEM_INSTRUCTION = """
+    RadLex is a comprehensive set of radiology terms for use in radiology reporting, decision support, data mining, data registries, education, and research. It is widely used in medical imaging, artificial intelligence, and clinical decision support systems to ensure consistent and precise descriptions of radiological findings.
+
+    However, the current synonym structure in RadLex is relatively **rigid and limited**, which restricts its applicability in diverse real-world clinical and AI-driven scenarios. Expanding and refining synonym mappings is essential to enhance its usability in **natural language processing (NLP), deep learning models, and automated clinical decision support systems**.
+
+    Generate synonyms and lexical variants for the following RadLex lexicon terms and categorize them into **four distinct groups**. 
+    **Important: Each generated synonym or lexical variant must fully capture the complete meaning of the original term as a complete phrase. Do not extract or generate only a partial component of the term.**  
+    **Before finalizing your response, double-check that every generated synonym or lexical variant fully encapsulates the complete clinical concept of the original term. If any of the outputs do not meet this requirement, please revise them accordingly.**  
+    **Return only the JSON object without any extra text or commentary.**
+    The expressions must be clinically relevant, medically precise, and commonly used in medical literature or practice.
+    
+    ### **Definition: Synonyms & Lexical Variants**
+    For the purpose of this task, **"synonyms"** refer strictly to terms that are **semantically equivalent and can be used interchangeably in all clinical contexts.**  
+    **"Lexical variants"** include morphological, orthographic, and abbreviation variations, which differ in form but not in meaning.
+    
+    ### **Categories of Synonyms & Lexical Variants:**
+    1. **Morphological Variants (Category 1):**  
+       - Terms that are **fully synonymous but differ in grammatical form** (e.g., noun vs. adjective, singular vs. plural, verb vs. participle).
+       - **Examples:**
+         - pleura vs. pleural  
+         - bronchiectasis vs. bronchiectatic  
+         - attenuation vs. attenuated vs. attenuating  
+    
+    2. **Orthographic Variants (Category 2):**  
+       - Terms that are **fully synonymous but differ only in spacing, hyphenation, or alternative spellings**.
+       - **Examples:**
+         - air trapping vs. air-trapping vs. airtrapping  
+         - airspace vs. air space vs. air-space  
+    
+    3. **Acronyms & Abbreviations (Category 3):**  
+       - Commonly used abbreviations or acronyms that are synonymous with the term.  
+       - **Examples:**
+         - myocardial infarction → MI  
+         - acute respiratory distress syndrome → ARDS  
+    
+    4. **Strict Semantic Synonyms (Category 4):**  
+       - Terms that **convey the exact same meaning and can be used interchangeably in all clinical contexts**.
+       - **Synonyms must be strictly equivalent and should not introduce ambiguity or potential contextual differences.**
+       - **Examples:**
+         - shortness of breath vs. dyspnea  
+         - neoplasm vs. tumorous condition  
+         - probably vs. likely  
+    
+Format the output as JSON:
+{
+  "term_and_synonyms": [
+    {
+      "term": "<lexicon 1>",
+      "category_1": ["Morphological Variant 1", "Morphological Variant 2", "Morphological Variant 3", ...],
+      "category_2": ["Orthographic Variant 1", "Orthographic Variant 2", "Orthographic Variant 3", ...],
+      "category_3": ["Acronym 1", "Acronym 2","Acronym 3", ...],
+      "category_4": ["Strict Semantic Synonym 1", "Strict Semantic Synonym 2", "Strict Semantic Synonym 3", ...]
+    }
+    ...
+  ]
+}
+""".strip()
+
+
+def generate_item_prompt(group):
+    """
+    Generates the per-call part of the prompt: only the delimited terms of a group.
+    """
+    combined_terms = "\n---TERM SEPARATOR---\n".join(group)
+    return f"terms:\n{combined_terms}"
+
+
+def generate_prompt(group):
+    """
+    Generates a Gemini prompt for a given group of reports.
+    """
+    return f"{SYSTEM_INSTRUCTION}\n\n{generate_item_prompt(group)}".strip()
+
+def parse_response(response_text, finish_reason=None):
+    """
+    Parses the text of a model response into its list of terms and synonyms
+    (see model_requests.parse_response).
+    """
+    return model_requests.parse_response(response_text, finish_reason, 'term_and_synonyms')
+
+
+def model_settings():
+    """
+    Returns the model settings above in the form model_requests.create_model_backend takes.
+    """
+    return dict(system_instruction=SYSTEM_INSTRUCTION if use_system_instruction else None,
+                context_cache_ttl=context_cache_ttl, synthesize=synthesize_response, model_name=model_name,
+                api_key=api_key, generation_config=generation_config, safety_settings=SAFETY_SETTINGS)
+
+
+def create_model_backend(name, **options):
+    """
+    Creates a model backend from the settings above; options override them.
+    The mock backend synthesizes valid responses unless it is given recordings to replay.
+    """
+    return model_requests.create_model_backend(name, model_settings(), **options)
+
+
+def create_model_pool(members, **options):
+    """
+    Creates a BackendPool from backend_pool-style member settings; options apply to every member.
+    """
+    return model_requests.create_model_pool(members, create_model_backend, backend_name, **options)
+
+
+def synthesize_response(prompt):
+    """
+    Builds a valid response for a prompt from generate_prompt with simple made-up variants of each term.
+    Used by the mock backend.
+    """
+    combined_terms = prompt.rsplit("terms:\n", 1)[-1]
+    results = []
+    for term in combined_terms.split("\n---TERM SEPARATOR---\n"):
+        words = term.split()
+        results.append({
+            "term": term,
+            "category_1": [term + "s"],
+            "category_2": ["-".join(words)] if len(words) > 1 else [],
+            "category_3": ["".join(word[0] for word in words).upper()] if len(words) > 1 else [],
+            "category_4": []
+        })
+    return json.dumps({"term_and_synonyms": results})
+
+
+def request_group(group, group_index, backend, rate_limiter=None, response_cache=None, streaming=False,
+                  metrics=None, cache_lookup=True):
+    """
+    Sends one request for a group of lexicon and returns the valid results keyed by the position of their term
+    (see model_requests.request_group).
+    """
+    return model_requests.request_group(
+        generate_prompt(group), generate_item_prompt(group), 'term_and_synonyms',
+        lambda results, complete: index_terms(results, group), len(group),
+        backend, rate_limiter, response_cache, streaming, metrics, cache_lookup)
+
+
+def process_group(group, group_index, backend, planner=None, rate_limiter=None, response_cache=None,
+                  streaming=False, metrics=None):
+    """
+    Processes a single group of lexicon and returns (results keyed by position within the group, failed positions).
+    Terms that parsed correctly are kept and only the missing ones are requested again
+    (see model_requests.process_group).
+    """
+    def request(terms, cache_lookup):
+        return request_group(terms, group_index, backend, rate_limiter, response_cache, streaming, metrics,
+                             cache_lookup)
+
+    return model_requests.process_group(group, group_index, request, planner, metrics, retry_delay=5)
+
+radlex_file = '###'
+output_file = '###'
+# Replace an output_file that has no checkpoint (e.g. from an older version) instead of refusing to start
+overwrite_output = False
+
+# Run mode: 'sync', 'batch-write' or 'batch-ingest' (as for unit_parsing.run_mode)
+run_mode = 'sync'
+batch_dir = '###'
+batch_results_file = '###'
+
+# Concurrency and API quota settings (None disables the corresponding limit)
+max_workers = 8
+requests_per_minute = 60
+tokens_per_minute = 1000000
+
+# Persistent response cache (None disables caching) and its size limit in bytes
+cache_file = 'response_cache.sqlite'
+cache_max_bytes = 2 * 1024 ** 3
+
+# Also treat terms that differ only in whitespace or case as duplicates
+normalize_duplicates = False
+
+# Stream responses and parse them while they arrive (as for unit_parsing.streaming)
+streaming = False
+
+# Send the static instructions once instead of in every prompt, optionally as a cached context that lives for
+# context_cache_ttl seconds (as for unit_parsing.use_system_instruction)
+use_system_instruction = True
+context_cache_ttl = 3600
+
+# Instrumentation: event log, metrics textfile, metrics server port and address, and progress summary interval
+# (as for unit_parsing.event_log_file)
+event_log_file = 'radlex_synonym_events.jsonl'
+metrics_file = None
+metrics_port = None
+metrics_host = '127.0.0.1'
+progress_interval = 10
+
+# Batch packing: at most lexicon_per_group terms per group, packed to the output token limit
+lexicon_per_group = 40
+
+def clean_synonyms(synonyms_list):
+    """Converts a list of synonyms into a clean string separated by '|' without brackets or quotes."""
+    if isinstance(synonyms_list, list):
+        return "|".join(synonyms_list)
+    return ""  # Return an empty string if no synonyms are present
+
+
+def is_valid_result(result):
+    """
+    Checks that a parsed result has a term and a synonym list (or nothing) for each of the four categories.
+    """
+    return "term" in result and all(
+        isinstance(result.get(f"category_{number}", []), list) for number in range(1, 5))
+
+
+def index_terms(results, group):
+    """
+    Maps the valid results of a parsed response to the 0-based positions of their terms within the group.
+    Terms are matched ignoring whitespace and case. Results whose term does not match any input are dropped,
+    so that the unmatched input terms are requested again.
+    """
+    positions_by_term = {}
+    for position, term in enumerate(group):
+        positions_by_term.setdefault(normalize_text(term), position)
+
+    indexed = {}
+    for result in results:
+        if not isinstance(result, dict) or not is_valid_result(result):
+            continue
+        position = positions_by_term.get(normalize_text(result["term"]))
+        if position is not None and position not in indexed:
+            indexed[position] = result
+    return indexed
+
+
+def read_lexicons(input_file, normalize_duplicates=False):
+    """
+    Streams the RadLex preferred labels (the 'Preferred Label' column; in Excel files, of Sheet1) from an .xlsx,
+    .csv, .jsonl or .parquet file and deduplicates them so each distinct term is sent to the model only once.
+    Only the distinct terms are kept in memory.
+    Returns (unique_lexicons, occurrences), where occurrences[i] lists the input rows of unique_lexicons[i].
+    """
+    labels = iter_input_column(input_file, column='Preferred Label', sheet_name='Sheet1')
+    unique_lexicons, occurrences = deduplicate(labels, normalize=normalize_duplicates)
+    print(f"Deduplicated {sum(map(len, occurrences))} terms to {len(unique_lexicons)} unique terms.")
+    return unique_lexicons, occurrences
+
+
+def plan_lexicon_groups(unique_lexicons, store, lexicon_per_group, target_input_tokens=None):
+    """
+    Packs the terms that have not finished in an earlier run into groups.
+    Returns the planner, a lazy iterator of (group_index, item_ids) pairs and the number of remaining terms.
+    """
+    completed_lexicons = store.manifest.prepare_resume(unique_lexicons)
+    if completed_lexicons:
+        print(f"Resuming: {len(completed_lexicons)} of {len(unique_lexicons)} unique terms already completed.")
+
+    # Synonym lists are much longer than the terms themselves
+    planner = BatchPlanner(lexicon_per_group, target_input_tokens=target_input_tokens,
+                           max_output_tokens=generation_config['max_output_tokens'], output_ratio=25.0)
+    remaining_lexicons = ((item_id, term) for item_id, term in enumerate(unique_lexicons)
+                          if item_id not in completed_lexicons)
+    return (planner, enumerate(planner.plan(remaining_lexicons), start=store.manifest.next_group_index()),
+            len(unique_lexicons) - len(completed_lexicons))
+
+
+def build_lexicon_rows(group_index, item_ids, indexed_results, failed_positions):
+    """
+    Converts the parsed results of a group into output rows, tagged for the checkpoint store.
+    Terms that failed get the error placeholder row.
+    """
+    indexed_results = dict(indexed_results)
+    indexed_results.update((position, ERROR_RESULT) for position in failed_positions)
+    rows = []
+    for position, result in sorted(indexed_results.items()):
+        rows.append({
+            "term": result["term"],
+            "category_1": clean_synonyms(result.get("category_1")),
+            "category_2": clean_synonyms(result.get("category_2")),
+            "category_3": clean_synonyms(result.get("category_3")),
+            "category_4": clean_synonyms(result.get("category_4")),
+            "Backend": result.get("backend"),
+            "_group": group_index,
+            "_item": item_ids[position]
+        })
+    return rows
+
+
+def process_lexicons(input_file, output_file, lexicon_per_group, max_workers=1,
+                     requests_per_minute=None, tokens_per_minute=None, checkpoint_dir=None,
+                     cache_file=None, cache_max_bytes=None, normalize_duplicates=False,
+                     target_input_tokens=None, backend=None, streaming=False, event_log_file=None,
+                     metrics_file=None, metrics_port=None, progress_interval=10, overwrite_output=False,
+                     metrics_host='127.0.0.1'):
+    """
+    Processes all lexicons in groups, keeping up to max_workers groups in flight at once.
+    Groups hold at most lexicon_per_group terms and are packed to target_input_tokens and to the model's
+    output token limit; truncated responses make later groups smaller.
+    Results are checkpointed in group order to an append-only store under checkpoint_dir
+    (default: "<output_file>.checkpoint") and written to output_file once at the end. An output_file without
+    a checkpoint is only replaced with overwrite_output (see CheckpointStore.for_output).
+    Parsed responses are cached in the SQLite file cache_file when it is given.
+    Duplicate terms are sent only once; their synonyms are written for every input row (Row Index) they appear in.
+    Requests go to backend (default: the backend or backend pool configured above), streamed when streaming is
+    set; the Backend column records which backend produced each row. requests_per_minute and tokens_per_minute
+    do not apply to a backend pool, whose members have their own limits.
+    Per-group performance measurements are written to the JSONL event_log_file and as Prometheus metrics to
+    metrics_file and/or metrics_host:metrics_port (see instrumentation.Instrumentation), with a live
+    throughput/ETA summary every progress_interval seconds.
+    Returns a summary of the run: group count, elapsed seconds, per-group latencies, checkpoint and export
+    time and token usage.
+    """
+    unique_lexicons, occurrences = read_lexicons(input_file, normalize_duplicates)
+    # Rows are checkpointed as append-only shards next to the output file
+    store = open_checkpoint(output_file, occurrences, checkpoint_dir, overwrite_output)
+
+    # Skip terms that already finished in an earlier run and group the rest to the token budget
+    planner, pending_groups, remaining_items = plan_lexicon_groups(unique_lexicons, store, lexicon_per_group,
+                                                                  target_input_tokens)
+
+    def process_items(item_ids, group_index, backend, rate_limiter, response_cache, metrics):
+        return process_group([unique_lexicons[item_id] for item_id in item_ids], group_index, backend, planner,
+                             rate_limiter=rate_limiter, response_cache=response_cache, streaming=streaming,
+                             metrics=metrics)
+
+    owns_backend = backend is None
+    if owns_backend:
+        backend = create_model_pool(backend_pool) if backend_pool else create_model_backend(backend_name)
+    return run_groups('radlex_synonym', store, unique_lexicons, pending_groups, remaining_items, process_items,
+                      build_lexicon_rows, output_file, OUTPUT_COLUMNS, INTEGER_COLUMNS, backend,
+                      max_workers=max_workers, requests_per_minute=requests_per_minute,
+                      tokens_per_minute=tokens_per_minute, cache_file=cache_file, cache_max_bytes=cache_max_bytes,
+                      event_log_file=event_log_file, metrics_file=metrics_file, metrics_port=metrics_port,
+                      metrics_host=metrics_host, progress_interval=progress_interval, close_backend=owns_backend)
+
+
+def write_lexicon_batch(input_file, output_file, batch_dir, lexicon_per_group, checkpoint_dir=None,
+                        normalize_duplicates=False, target_input_tokens=None, overwrite_output=False):
+    """
+    Writes the prompts of all groups that have not finished yet as a sharded batch job in batch_dir
+    (see runner.write_batch). Run ingest_lexicon_batch on the results file afterwards.
+    """
+    unique_lexicons, occurrences = read_lexicons(input_file, normalize_duplicates)
+    store = open_checkpoint(output_file, occurrences, checkpoint_dir, overwrite_output)
+    _, pending_groups, _ = plan_lexicon_groups(unique_lexicons, store, lexicon_per_group, target_input_tokens)
+    write_batch('radlex_synonym', unique_lexicons, pending_groups, lambda group, group_index: generate_prompt(group),
+                batch_dir, generation_config, SAFETY_SETTINGS)
+
+
+def ingest_lexicon_batch(batch_dir, results_file, output_file, checkpoint_dir=None, overwrite_output=False):
+    """
+    Ingests a batch results JSONL file and writes the output file (see runner.ingest_batch).
+    Terms that are missing or invalid get the error placeholder row and are marked failed, so the next run
+    (synchronous or batch) sends only them.
+    """
+    ingest_batch(batch_dir, results_file, 'term_and_synonyms', index_terms, build_lexicon_rows,
+                 f"batch:{model_name}", output_file, OUTPUT_COLUMNS, INTEGER_COLUMNS, checkpoint_dir,
+                 overwrite_output)
+
+def lexicon_options():
+    """
+    Returns the process_lexicons keyword arguments given by the settings above.
+    """
+    return dict(lexicon_per_group=lexicon_per_group, max_workers=max_workers,
+                requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, cache_file=cache_file,
+                cache_max_bytes=cache_max_bytes, normalize_duplicates=normalize_duplicates, streaming=streaming,
+                event_log_file=event_log_file, metrics_file=metrics_file, metrics_port=metrics_port,
+                metrics_host=metrics_host, progress_interval=progress_interval, overwrite_output=overwrite_output)
+
+
+def run():
+    """
+    Processes the lexicons in run_mode with the settings above.
+    """
+    if run_mode == 'batch-write':
+        write_lexicon_batch(radlex_file, output_file, batch_dir, lexicon_per_group=lexicon_per_group,
+                            normalize_duplicates=normalize_duplicates, overwrite_output=overwrite_output)
+    elif run_mode == 'batch-ingest':
+        ingest_lexicon_batch(batch_dir, batch_results_file, output_file, overwrite_output=overwrite_output)
+    else:
+        return process_lexicons(radlex_file, output_file, **lexicon_options())
+
+
+# Process the reports
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,126 @@
+import dataclasses
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def _config_fingerprint(generation_config):
+    """
+    Converts a generation config (dataclass, dict or other object) into a stable string.
+    """
+    if dataclasses.is_dataclass(generation_config):
+        generation_config = dataclasses.asdict(generation_config)
+    elif not isinstance(generation_config, dict):
+        generation_config = repr(generation_config)
+    return json.dumps(generation_config, sort_keys=True, default=str)
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of parsed model responses stored in a local SQLite file.
+    Entries are keyed by a hash of the prompt text, model name and generation config.
+    When max_bytes is set, the least recently used entries are evicted once the cache grows past it.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        # One connection shared by all worker threads, serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._total_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt, model_name, generation_config):
+        """
+        Returns the cache key for a prompt sent to a model with a given generation config.
+        """
+        content = '\x1f'.join([model_name, _config_fingerprint(generation_config), prompt])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached parsed response for key, or None on a miss.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        Stores a parsed response under key and evicts old entries if the cache is over its size limit.
+        """
+        text = json.dumps(value, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        with self._lock:
+            previous = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()))
+            self._total_bytes += size - (previous[0] if previous else 0)
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Deletes least recently used entries until the cache is back under 90% of max_bytes.
+        """
+        target_bytes = self.max_bytes * 0.9
+        while self._total_bytes > target_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= target_bytes:
+                    break
+
+    def stats(self):
+        """
+        Returns hit/miss statistics and the current size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': self._total_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,187 @@
+import time
+
+from .backend_pool import BackendPool, tag_backend
+from .batch_jobs import load_batch_groups, make_custom_id, read_batch_results, write_batch_requests
+from .checkpoint import CheckpointStore, group_hash
+from .dispatch import RateLimiter, dispatch_groups
+from .failure_isolation import classify_error
+from .instrumentation import Instrumentation
+from .model_requests import parse_response
+from .response_cache import ResponseCache
+
+
+def open_checkpoint(output_file, occurrences, checkpoint_dir=None, overwrite_output=False):
+    """
+    Opens the checkpoint store of output_file (see CheckpointStore.for_output) and records which input rows
+    each deduplicated item stands for.
+    """
+    store = CheckpointStore.for_output(output_file, checkpoint_dir, overwrite_output)
+    store.record_occurrences(occurrences)
+    return store
+
+
+def run_groups(pipeline, store, unique_items, pending_groups, remaining_items, process_items, build_rows,
+               output_file, output_columns, integer_columns, backend, max_workers=1, requests_per_minute=None,
+               tokens_per_minute=None, cache_file=None, cache_max_bytes=None, event_log_file=None,
+               metrics_file=None, metrics_port=None, metrics_host='127.0.0.1', progress_interval=10,
+               on_rows=None, close_backend=False):
+    """
+    Runs the planned groups of a pipeline ('unit_parsing' or 'radlex_synonym') through backend, checkpoints
+    their rows in group order and exports the output file once at the end.
+
+    pending_groups yields (group_index, item_ids) pairs of unique_items. Each group is processed with
+    process_items(item_ids, group_index, backend, rate_limiter, response_cache, metrics), which returns
+    (results keyed by position, failed positions), and turned into output rows with
+    build_rows(group_index, item_ids, results, failed_positions). on_rows, if given, is called with the rows
+    of every finished group before they are checkpointed.
+    The response cache, instrumentation and, with close_backend, the backend are closed when the run ends,
+    also when it fails. Returns a summary of the run: group count, elapsed seconds, per-group latencies,
+    checkpoint and export time and token usage.
+    """
+    response_cache = None
+    instrumentation = None
+    try:
+        # A backend pool enforces the quota of each of its members instead
+        rate_limiter = None
+        if (requests_per_minute or tokens_per_minute) and not isinstance(backend, BackendPool):
+            rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+        all_results = []  # Store all results
+        flushed_groups = []  # (group_index, group_hash, item_ids, failed_item_ids) of the groups in all_results
+        group_latencies = []  # Processing time of each group, including retries
+        start_time = time.time()  # Start the timer for cumulative processing
+
+        response_cache = ResponseCache(cache_file, cache_max_bytes) if cache_file else None
+
+        instrumentation = Instrumentation(pipeline, remaining_items, event_log_file, metrics_file, metrics_port,
+                                          progress_interval, metrics_host)
+
+        def worker(item_ids, group_index):
+            metrics = instrumentation.start_group(group_index, len(item_ids))
+            return process_items(item_ids, group_index, backend, rate_limiter, response_cache, metrics)
+
+        def checkpoint():
+            checkpoint_start = time.time()
+            store.append(all_results, flushed_groups)
+            instrumentation.record_checkpoint([flushed[0] for flushed in flushed_groups], len(all_results),
+                                              time.time() - checkpoint_start)
+
+        for outcome in dispatch_groups(pending_groups, worker, max_workers=max_workers):
+            group_index = outcome.group_index
+            item_ids = outcome.group
+            indexed_results, failed_positions = outcome.result
+
+            rows = build_rows(group_index, item_ids, indexed_results, failed_positions)
+            if on_rows is not None:
+                on_rows(rows)
+            all_results.extend(rows)
+            # Items that failed after all retries are re-sent on the next run
+            group = [unique_items[item_id] for item_id in item_ids]
+            flushed_groups.append((group_index, group_hash(group), item_ids,
+                                   [item_ids[position] for position in failed_positions]))
+            group_latencies.append(outcome.elapsed)
+            instrumentation.finish_group(group_index, outcome.queue_wait, outcome.elapsed, len(failed_positions))
+
+            # Checkpoint every 20 groups
+            if len(flushed_groups) >= 20:
+                print(f"Checkpointing results for groups up to {group_index}...")
+                checkpoint()
+                all_results = []  # Clear intermediate results after checkpoint
+                flushed_groups = []
+
+        # Checkpoint any remaining results and build the output file once
+        if flushed_groups:
+            print("Checkpointing remaining results...")
+            checkpoint()
+        print(f"Exporting results to {output_file}...")
+        export_start = time.time()
+        store.export(output_file, output_columns, integer_columns)
+        instrumentation.record_export(output_file, time.time() - export_start)
+
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            print(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                  f"(hit rate {cache_stats['hit_rate']:.1%}), {cache_stats['entries']} entries, "
+                  f"{cache_stats['evictions']} evicted.")
+
+        usage = backend.usage.summary()
+        print(f"Token usage: {usage['calls']} calls, {usage['input_tokens']} input tokens "
+              f"({usage['cached_tokens']} cached, {usage['uncached_input_tokens_per_call']:.0f} uncached per call), "
+              f"{usage['output_tokens']} output tokens.")
+    finally:
+        # Release the cache, metrics server and backend also when the run fails or is interrupted
+        if response_cache is not None:
+            response_cache.close()
+        if instrumentation is not None:
+            instrumentation.close()
+        if close_backend:
+            backend.close()
+
+    total_elapsed_time = time.time() - start_time
+    print(f"Processing completed. Total elapsed time: {total_elapsed_time:.2f} seconds.")
+    return {'groups': len(group_latencies), 'unique_items': len(unique_items), 'elapsed': total_elapsed_time,
+            'group_latencies': group_latencies, 'checkpoint_time': instrumentation.checkpoint_time,
+            'export_time': instrumentation.export_time, 'usage': usage}
+
+
+def write_batch(pipeline, unique_items, pending_groups, generate_prompt, batch_dir, generation_config,
+                safety_settings=None):
+    """
+    Writes the prompts of the planned groups as a sharded batch job (requests-NNNNN.jsonl) in batch_dir, for
+    submission to a batch endpoint; generate_prompt(group, group_index) builds each prompt.
+    Run ingest_batch on the results file afterwards.
+    """
+    def batch_requests():
+        for group_index, item_ids in pending_groups:
+            group = [unique_items[item_id] for item_id in item_ids]
+            custom_id = make_custom_id(pipeline, group_index, group_hash(group))
+            yield custom_id, generate_prompt(group, group_index), {'group_index': group_index,
+                                                                   'items': item_ids, 'group': group}
+
+    shard_paths = write_batch_requests(batch_dir, batch_requests(), generation_config, safety_settings)
+    print(f"Wrote batch requests to {len(shard_paths)} shards in {batch_dir}.")
+
+
+def ingest_batch(batch_dir, results_file, response_key, index, build_rows, backend_label, output_file,
+                 output_columns, integer_columns, checkpoint_dir=None, overwrite_output=False):
+    """
+    Ingests a batch results JSONL file through the same parsing and validation as synchronous requests and
+    writes the output file. Each response is parsed into the list under response_key, tagged with backend_label
+    and mapped to positions in its group with index(items, group); output rows are built with
+    build_rows(group_index, item_ids, results, failed_positions). Items that are missing or invalid are
+    marked failed, so the next run (synchronous or batch) sends only them.
+    """
+    batch_groups = load_batch_groups(batch_dir)
+    store = CheckpointStore.for_output(output_file, checkpoint_dir, overwrite_output)
+
+    all_results = []  # Store all results
+    flushed_groups = []  # (group_index, group_hash, item_ids, failed_item_ids) of the groups in all_results
+    for custom_id, response_text, finish_reason, error in read_batch_results(results_file):
+        record = batch_groups.get(custom_id)
+        if record is None:
+            print(f"Skipping result with unknown custom ID {custom_id}.")
+            continue
+        group_index, item_ids, group = record['group_index'], record['items'], record['group']
+
+        try:
+            if error is not None:
+                raise ValueError(f"Batch request failed: {error}")
+            items = tag_backend(parse_response(response_text, finish_reason, response_key), backend_label)
+            indexed_results = index(items, group)
+        except Exception as e:
+            print(f"Error ingesting group {group_index} ({classify_error(e)}): {e}")
+            indexed_results = {}
+
+        failed_positions = [position for position in range(len(group)) if position not in indexed_results]
+        all_results.extend(build_rows(group_index, item_ids, indexed_results, failed_positions))
+        flushed_groups.append((group_index, group_hash(group), item_ids,
+                               [item_ids[position] for position in failed_positions]))
+        if len(flushed_groups) >= 1000:
+            store.append(all_results, flushed_groups)
+            all_results = []
+            flushed_groups = []
+
+    if flushed_groups:
+        store.append(all_results, flushed_groups)
+    print(f"Exporting results to {output_file}...")
+    store.export(output_file, output_columns, integer_columns)
@@ -0,0 +1,106 @@
+import json
+import re
+
+from .failure_isolation import MalformedResponseError
+
+
+class IncrementalArrayParser:
+    """
+    Incrementally parses the objects of one top-level JSON array (e.g. "reports") out of a streamed response.
+
+    feed(chunk) returns the objects that were completed by the chunk, so parsing keeps pace with the stream
+    instead of starting after the whole response. Text around the JSON (such as code fences) is ignored.
+    Only the unfinished tail of the stream is kept in memory.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.started = False  # The opening bracket of the array was seen
+        self.finished = False  # The closing bracket of the array was seen
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ''
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+
+    def feed(self, chunk):
+        """
+        Adds the next chunk of response text and returns the list of array items it completed.
+        """
+        self._buffer += chunk
+        if not self.started:
+            match = self._key_pattern.search(self._buffer)
+            if match is None:
+                # Keep only enough text to match a key that is split across chunks
+                self._buffer = self._buffer[-(len(self.key) + 64):]
+                return []
+            self.started = True
+            self._buffer = self._buffer[match.end():]
+            self._position = 0
+
+        items = []
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer) and not self.finished:
+            char = buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._item_start = position
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # The closing bracket of the array itself
+                    self.finished = char == ']'
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._item_start is not None:
+                        items.append(self._load_item(buffer[self._item_start:position + 1]))
+                        self._item_start = None
+            position += 1
+
+        # Drop the text of the items that were already emitted
+        keep_from = self._item_start if self._item_start is not None else position
+        self._buffer = buffer[keep_from:]
+        self._position = position - keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
+
+    @staticmethod
+    def _load_item(text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise MalformedResponseError(f"Invalid JSON item in the streamed response: {e}") from e
+
+
+def stream_items(chunks, key):
+    """
+    Collects the items of the array named key from streamed response chunks (ModelResponse tuples).
+    The items are returned together once the stream has ended, as (items, complete), where complete is False
+    if the stream ended inside the array, i.e. the response was truncated after the returned items.
+    Raises MalformedResponseError if the stream did not contain the array at all.
+    """
+    parser = IncrementalArrayParser(key)
+    items = []
+    finish_reason = None
+    for chunk in chunks:
+        if chunk.text:
+            items.extend(parser.feed(chunk.text))
+        finish_reason = chunk.finish_reason or finish_reason
+    if not parser.started:
+        if getattr(finish_reason, 'name', finish_reason) == 'MAX_TOKENS':
+            return items, False
+        raise MalformedResponseError(f"Invalid response format: '{key}' key not found.")
+    return items, parser.finished
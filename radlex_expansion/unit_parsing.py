@@ -0,0 +1,621 @@
+import json
+import re
+
+from . import model_requests
+from .batch_planner import BatchPlanner
+from .checkpoint import group_hash
+from .dedup import deduplicate
+from .input_readers import iter_input_column
+from .presegmenter import build_segmenter, is_covered
+from .runner import ingest_batch, open_checkpoint, run_groups, write_batch
+
+# Define file paths
+input_file = '####'
+output_file = '####'
+# Replace an output_file that has no checkpoint (e.g. from an older version) instead of refusing to start
+overwrite_output = False
+
+# Run mode: 'sync' calls the API directly; 'batch-write' writes a batch job to batch_dir and
+# 'batch-ingest' reads its results from batch_results_file
+run_mode = 'sync'
+batch_dir = '####'
+batch_results_file = '####'
+
+# Concurrency and API quota settings (None disables the corresponding limit)
+max_workers = 8
+requests_per_minute = 60
+tokens_per_minute = 1000000
+
+# Persistent response cache (None disables caching) and its size limit in bytes
+cache_file = 'response_cache.sqlite'
+cache_max_bytes = 2 * 1024 ** 3
+
+# Also treat reports that differ only in whitespace or case as duplicates
+normalize_duplicates = False
+
+# Stream responses and parse them while they arrive instead of after the whole response; the reports of a
+# group are still passed on together once its response has ended
+streaming = False
+
+# Send the static instructions once as a system instruction instead of repeating them in every prompt, so each
+# call carries only the delimited reports; with context_cache_ttl (seconds), Gemini keeps them in a cached
+# context that is re-created when it expires
+use_system_instruction = True
+context_cache_ttl = 3600
+
+# Instrumentation: JSONL event log, Prometheus metrics textfile and HTTP port (None disables each), the address
+# the metrics server listens on ('0.0.0.0' exposes it to the network), and how often (seconds) the live
+# throughput/ETA summary is printed
+event_log_file = 'unit_parsing_events.jsonl'
+metrics_file = None
+metrics_port = None
+metrics_host = '127.0.0.1'
+progress_interval = 10
+
+# Local pre-segmentation: reports made up entirely of units that the model produced for at least
+# presegment_min_count reports in earlier unit_parsing outputs (plus the RadLex labels and synonyms of those
+# units from radlex_synonym outputs) are segmented without calling the model. presegment_mode: None (off),
+# 'report' (other reports are sent whole) or 'span' (partially known reports send only their unresolved spans,
+# which saves tokens but gives the model less context)
+presegment_mode = None
+presegment_unit_files = []
+presegment_radlex_files = []
+presegment_min_count = 2
+
+# Batch packing: at most reports_per_group reports and about target_input_tokens report tokens per group
+reports_per_group = 20
+target_input_tokens = 2000
+
+# Model backend: 'gemini', 'openai' or 'mock' (a local stand-in that synthesizes responses, see backends.py)
+backend_name = 'gemini'
+api_key = "####"
+model_name = "gemini-2.0-flash-thinking-exp-01-21"
+generation_config = {'temperature': 0.0, 'max_output_tokens': 8192}
+
+# Backend pool: when given, groups are spread across these credential/model pairs instead of the single backend
+# above, each with its own quota, health tracking and circuit breaker, failing over to the next pair on quota and
+# API errors (see backend_pool.BackendPool). Each entry holds create_model_backend options ('backend' names the
+# backend, default backend_name) and optionally 'label', 'requests_per_minute' and 'tokens_per_minute', e.g.
+# [{'api_key': '####', 'requests_per_minute': 60},
+#  {'api_key': '####', 'model_name': 'gemini-2.0-flash', 'requests_per_minute': 120}]
+backend_pool = None
+SAFETY_SETTINGS = {
+    'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
+    'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
+    'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE',
+    'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE'
+}
+
+# Columns of the output file
+OUTPUT_COLUMNS = ['Group Index', 'Report Index', 'Row Index', 'Unit', 'Category', 'Backend']
+INTEGER_COLUMNS = ['Group Index', 'Report Index', 'Row Index', 'Category']
+
+def clean_and_parse_json(response_text):
+    """
+    Cleans and parses the JSON response text from the API.
+    """
+    try:
+        # Remove extra characters or non-JSON prefixes
+        cleaned_text = response_text.strip(' \n')
+        if cleaned_text.lower().startswith('json'):
+            cleaned_text = cleaned_text[4:].strip()
+
+        # Match and extract JSON content
+        json_match = re.search(r'\{.*\}', cleaned_text, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(0))
+        else:
+            raise ValueError("No valid JSON object found.")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSONDecodeError: {e}")
+
+
+# Static instructions shared by every request; sent once as a system instruction or cached context
+# when use_system_instruction is set, and in front of the items otherwise
+SYSTEM_INSTRUCTION = """
+    This word string is a CT reports that have undergone de-identification and preprocessing. 
+
+    Your task:
+    1. Correct typos in the word strings to their most likely intended forms based on medical terminology.
+       - Ensure that anatomical expressions use the correct parts of speech. For example, "mediastinum lymph node" should be corrected to "mediastinal lymph node."
+       - If anatomical locations are connected by "and" or "or", explicitly expand them to ensure each location is fully described:
+         - Example: "right internal mammary and left axillary lymph node" should be expanded to "right internal mammary lymph node and left axillary lymph node."
+    2. Divide the corrected word strings into **concise lexicon units** and assign each unit to one of the following categories:
+       - **1. Anatomical entity with location**: Anatomical structures combined with their positional descriptions (e.g., "upper lobe of right lung", "superior pole of left kidney", "mediastinal lymph node").
+           - **Do not split anatomical components** such as "lung, lobe, segment" or similar hierarchical descriptions into separate units. These must be combined into a single lexicon unit.
+       - **2. Physiologic condition**: Functional or pathological states or processes occurring within the body. These are inherent conditions (e.g., "hyperinflation", "consolidation", "fibrosis", "granuloma", "cyst", "bronchiectasis", "atelectasis", "lymphadenopathy", "coronary artery calcification") or **symptoms** such as "cough", "pain", or "shortness of breath" when directly stated in the text. These are **not explicitly described as visual observations** on imaging.
+       - **3. Imaging observation**: Findings or abnormalities described as direct **visual interpretations** from imaging (e.g., "ill-defined margin", "nodular opacity", "ground-glass pattern"). These are descriptive terms that indicate how a condition appears in imaging studies.
+           - **Key distinction**:
+             - If the term refers to a condition inherently existing in the body (e.g., "fibrosis", "consolidation", "lymphadenopathy"), it belongs to **Physiologic condition**.
+             - If the term refers to how the condition is visually described on imaging (e.g., "ground-glass opacity", "nodular appearance"), it belongs to **Imaging observation**.
+           - Example:
+             - "Fibrosis" → **Physiologic condition**
+             - "Reticular pattern of fibrosis" → **Imaging observation**
+             - "Nodular opacity" → **Imaging observation**
+             - "Pulmonary nodules" → **Imaging observation**
+             - "Chronic interstitial pneumonia" → **Physiologic condition**
+       - **4. Physical object**: Any external or internal object mentioned in the report (e.g., "stent", "catheter", "surgical clip").
+           - **Important clarification**: Physical object must refer to an artificially introduced or external structure. Natural formations within the body, even if they resemble objects (e.g., stones, calculi), should not be categorized here. Instead, classify them as 2. Physiologic condition if they indicate a pathological state.
+       - **5. Procedure**: Any medical or surgical process or action (e.g., "biopsy", "contrast-enhanced CT scan", "follow up procedure").
+       - **6. Others**: Use this category if the unit does not fit into the above categories (e.g., "clinical information section") or the meaning is unclear.
+
+    3. Follow these **Important Rules** when creating the lexicon units:
+       - A single lexicon unit **must not mix categories**. For example:
+         - Incorrect: "renal mass and biopsy procedure".
+         - Correct: ["renal mass", "biopsy procedure"].
+       - Findings and locations must be **split into separate units**:
+         - Example 1: "consolidation in lower lobe of right lung" → ["consolidation", "lower lobe of right lung"].
+         - Example 2: "nodular opacity in upper lobe of left lung" → ["nodular opacity", "upper lobe of left lung"].
+       - **Handle conjunctions properly**:
+         - If items are connected by "and", "or", or similar conjunctions, split them into separate units:
+           - Example: "biopsy or surgery" → ["biopsy", "surgery"].
+         - If conjunctions are missing but implied, infer the separation:
+           - Example: "diffuse ground-glass opacity consolidation nodular opacity" → ["diffuse ground-glass opacity", "consolidation", "nodular opacity"].
+         - For anatomical locations connected by "and" or "or", ensure each is expanded to a fully described location before splitting:
+           - Example: "right internal mammary and left axillary lymph node" → ["right internal mammary lymph node", "left axillary lymph node"]. 
+           
+       - **Avoid overly long units**:
+         - Long expressions should be split into smaller meaningful components:
+           - Example: "low attenuating lesion in right thyroid gland" → ["low attenuating lesion", "right thyroid gland"].
+
+    4. Always ensure:
+       - The original word order is preserved.
+       - Typos are corrected, and meaningless words are removed or replaced during the correction process.
+       - findings and locations must be split into separate units
+
+    ### Additional Guidance for Ambiguous Cases:
+    - When terms seem ambiguous, follow these guidelines:
+      1. **Check for explicit imaging-related descriptors**:
+         - Words like "opacity", "pattern", "margin", "enhancement" often indicate **Imaging observation**.
+      2. **Default to Physiologic condition**:
+         - If a term could describe a general condition without clear imaging context, assign it to **Physiologic condition**.
+      3. **Complex units**: 
+         - Break down terms with both a visual and physiologic aspect:
+           - Example: "reticular opacity of lung fibrosis" → ["reticular opacity", "lung fibrosis"].
+
+Format the output as JSON:
+{
+  "reports": [
+    {
+      "report_index": <number of the report as given in the prompt, starting at 1>,
+      "lexicon_units": [
+        {"unit": "<unit1>", "category": <category_number>},
+        {"unit": "<unit2>", "category": <category_number>},
+        ...
+      ]
+    }
+    ...
+  ]
+}
+
+Example reports:
+Report 1: "reticular opacity and consolidation in lower lobe of right lung superior segment bronchial wall thickening and centrilobular nodule in upper lobe of left lung peripheral portion"
+Expected output:
+{
+  "report_index": 1,
+  "lexicon_units": [
+    {"unit": "reticular opacity", "category": 3},
+    {"unit": "consolidation", "category": 2},
+    {"unit": "lower lobe of right lung superior segment", "category": 1},
+    {"unit": "bronchial wall thickening", "category": 3},
+    {"unit": "centrilobular nodule", "category": 3},
+    {"unit": "upper lobe of left lung", "category": 1},
+    {"unit": "peripheral portion", "category": 1},
+  ]
+}
+""".strip()
+
+
+def generate_item_prompt(group):
+    """
+    Generates the per-call part of the prompt: only the delimited reports of a group, numbered from 1.
+    """
+    combined_reports = "\n---REPORT SEPARATOR---\n".join(
+        f"Report {number}: {report}" for number, report in enumerate(group, start=1))
+    return f"Reports:\n{combined_reports}"
+
+
+def generate_prompt(group, group_index):
+    """
+    Generates a GPT prompt for a given group of reports.
+    """
+    return f"{SYSTEM_INSTRUCTION}\n\n{generate_item_prompt(group)}".strip()
+
+
+def parse_response(response_text, finish_reason=None):
+    """
+    Parses the text of a model response into its list of reports (see model_requests.parse_response).
+    """
+    return model_requests.parse_response(response_text, finish_reason, 'reports')
+
+
+def model_settings():
+    """
+    Returns the model settings above in the form model_requests.create_model_backend takes.
+    """
+    return dict(system_instruction=SYSTEM_INSTRUCTION if use_system_instruction else None,
+                context_cache_ttl=context_cache_ttl, synthesize=synthesize_response, model_name=model_name,
+                api_key=api_key, generation_config=generation_config, safety_settings=SAFETY_SETTINGS)
+
+
+def create_model_backend(name, **options):
+    """
+    Creates a model backend from the settings above; options override them.
+    The mock backend synthesizes valid responses unless it is given recordings to replay.
+    """
+    return model_requests.create_model_backend(name, model_settings(), **options)
+
+
+def create_model_pool(members, **options):
+    """
+    Creates a BackendPool from backend_pool-style member settings; options apply to every member.
+    """
+    return model_requests.create_model_pool(members, create_model_backend, backend_name, **options)
+
+
+def synthesize_response(prompt):
+    """
+    Builds a valid response for a prompt from generate_prompt, splitting each report into units of up to
+    three words. Used by the mock backend.
+    """
+    combined_reports = prompt.rsplit("Reports:\n", 1)[-1]
+    reports = []
+    for report in combined_reports.split("\n---REPORT SEPARATOR---\n"):
+        number, _, report = report.partition(": ")
+        words = report.split()
+        units = [{"unit": " ".join(words[start:start + 3]), "category": (start // 3) % 6 + 1}
+                 for start in range(0, len(words), 3)]
+        reports.append({"report_index": int(number.split()[-1]), "lexicon_units": units})
+    return json.dumps({"reports": reports})
+
+
+def request_group(group, group_index, backend, rate_limiter=None, response_cache=None, streaming=False,
+                  metrics=None, cache_lookup=True):
+    """
+    Sends one request for a group of reports and returns the valid reports keyed by their position in the group
+    (see model_requests.request_group).
+    """
+    return model_requests.request_group(
+        generate_prompt(group, group_index), generate_item_prompt(group), 'reports',
+        lambda reports, complete: index_reports(reports, len(group), complete), len(group),
+        backend, rate_limiter, response_cache, streaming, metrics, cache_lookup)
+
+
+def is_valid_report(report):
+    """
+    Checks that a parsed report has a list of lexicon units, each with a unit and an integer category.
+    Categories given as numeric strings ("3") are converted to integers in place.
+    """
+    units = report.get("lexicon_units")
+    if not isinstance(units, list):
+        return False
+    for unit in units:
+        if not isinstance(unit, dict) or "unit" not in unit:
+            return False
+        category = unit.get("category")
+        if isinstance(category, str) and category.strip().isdigit():
+            category = unit["category"] = int(category)
+        if not isinstance(category, int) or isinstance(category, bool):
+            return False
+    return True
+
+
+def index_reports(reports, group_size, complete=True):
+    """
+    Maps each valid report in a parsed response to its 0-based position within the group.
+    The prompt numbers the reports from 1 and asks for that number as report_index. A response numbered from 0
+    is still accepted when it says so (an index of 0); when a response is missing reports and its indices fit
+    both bases, it is left out entirely, so that its reports are requested again rather than shifted onto the
+    wrong ones. If the indices cannot be used, reports are matched by their order when the counts agree.
+    Reports that are missing or malformed are left out, so that only they are requested again.
+    complete=False marks the leading reports of a truncated response, which start with the first report.
+    """
+    reports = [report for report in reports if isinstance(report, dict)]
+    try:
+        indices = [int(report["report_index"]) for report in reports]
+    except (KeyError, TypeError, ValueError):
+        indices = None
+
+    indexed = {}
+    if indices and len(set(indices)) == len(indices):
+        if 0 in indices:
+            offset = 0
+        elif max(indices) == group_size or not complete:
+            offset = 1
+        else:
+            # Neither 0 nor the last number: the reports could be numbered from 0 or from 1
+            return {}
+        positions = [index - offset for index in indices]
+        if all(0 <= position < group_size for position in positions):
+            indexed = dict(zip(positions, reports))
+    if not indexed and len(reports) == group_size:
+        indexed = dict(enumerate(reports))
+    return {position: report for position, report in indexed.items() if is_valid_report(report)}
+
+
+def process_group(group, group_index, backend, planner=None, rate_limiter=None, response_cache=None,
+                  streaming=False, metrics=None):
+    """
+    Processes a single group of reports and returns (reports keyed by position within the group, failed positions).
+    Reports that parsed correctly are kept and only the missing ones are requested again
+    (see model_requests.process_group).
+    """
+    def request(reports, cache_lookup):
+        return request_group(reports, group_index, backend, rate_limiter, response_cache, streaming, metrics,
+                             cache_lookup)
+
+    return model_requests.process_group(group, group_index, request, planner, metrics, retry_delay=2)
+
+def append_to_excel(group_index, group_results, output_df):
+    """
+    Appends processed group results to an Excel file.
+    """
+
+
+
+def read_reports(input_file, normalize_duplicates=False):
+    """
+    Streams the reports (first column, no header row) from an .xlsx, .csv, .jsonl or .parquet file and
+    deduplicates them so each distinct report is sent to the model only once. Only the distinct reports are
+    kept in memory.
+    Returns (unique_reports, occurrences), where occurrences[i] lists the input rows of unique_reports[i].
+    """
+    unique_reports, occurrences = deduplicate(iter_input_column(input_file, column=0, header=False),
+                                              normalize=normalize_duplicates)
+    print(f"Deduplicated {sum(map(len, occurrences))} reports to {len(unique_reports)} unique reports.")
+    return unique_reports, occurrences
+
+
+def plan_report_groups(unique_reports, store, reports_per_group, target_input_tokens=None, prompt_texts=None):
+    """
+    Packs the reports that have not finished in an earlier run into groups.
+    prompt_texts maps item ids to the text actually sent for them (their unresolved spans), if it differs.
+    Returns the planner, a lazy iterator of (group_index, item_ids) pairs and the number of remaining reports.
+    """
+    completed_reports = store.manifest.prepare_resume(unique_reports)
+    if completed_reports:
+        print(f"Resuming: {len(completed_reports)} of {len(unique_reports)} unique reports already completed.")
+
+    planner = BatchPlanner(reports_per_group, target_input_tokens=target_input_tokens,
+                           max_output_tokens=generation_config['max_output_tokens'])
+    prompt_texts = prompt_texts or {}
+    remaining_reports = ((item_id, prompt_texts.get(item_id, report))
+                         for item_id, report in enumerate(unique_reports) if item_id not in completed_reports)
+    return (planner, enumerate(planner.plan(remaining_reports), start=store.manifest.next_group_index()),
+            len(unique_reports) - len(completed_reports))
+
+
+def build_report_rows(group_index, item_ids, indexed_reports, failed_positions=()):
+    """
+    Converts the parsed reports of a group into output rows, tagged for the checkpoint store.
+    Failed reports get no rows.
+    """
+    rows = []
+    for position, report in sorted(indexed_reports.items()):
+        for unit in report["lexicon_units"]:
+            rows.append({
+                'Group Index': group_index,
+                'Report Index': position,
+                'Unit': unit["unit"],
+                'Category': unit["category"],
+                'Backend': report.get("backend"),
+                '_group': group_index,
+                '_item': item_ids[position]
+            })
+    return rows
+
+
+def presegment_reports(unique_reports, store, segmenter, mode='report', local_group_size=1000, on_rows=None):
+    """
+    Writes the units of every remaining report that the segmenter fully covers straight to the store, as
+    local groups that never reach the model (and passes their rows to on_rows, if given). In 'span' mode,
+    returns the segments of the partially covered reports, keyed by item id, so that only their unresolved
+    spans are sent (see expand_spans).
+    """
+    completed_reports = store.manifest.prepare_resume(unique_reports)
+    span_segments = {}
+    local_count = 0
+    item_ids = []
+    indexed_reports = {}
+
+    def flush():
+        group_index = store.manifest.next_group_index()
+        group = [unique_reports[item_id] for item_id in item_ids]
+        rows = build_report_rows(group_index, item_ids, indexed_reports)
+        if on_rows is not None:
+            on_rows(rows)
+        store.append(rows, [(group_index, group_hash(group), list(item_ids), [])])
+
+    for item_id, report in enumerate(unique_reports):
+        if item_id in completed_reports:
+            continue
+        segments = segmenter.segment(report)
+        if is_covered(segments):
+            indexed_reports[len(item_ids)] = {
+                "lexicon_units": [{"unit": unit, "category": category} for unit, category in segments],
+                "backend": 'local'}
+            item_ids.append(item_id)
+            local_count += 1
+            if len(item_ids) >= local_group_size:
+                flush()
+                item_ids = []
+                indexed_reports = {}
+        elif mode == 'span' and any(segment.category is not None for segment in segments):
+            span_segments[item_id] = segments
+    if item_ids:
+        flush()
+
+    print(f"Pre-segmented {local_count} reports locally; {len(span_segments)} partially known reports "
+          f"will send only their unresolved spans.")
+    return span_segments
+
+
+def expand_spans(item_ids, unique_reports, span_segments):
+    """
+    Returns the texts to send for a group and, for each text, the position of its report in the group:
+    the unresolved spans of pre-segmented reports (each sent as a separate entry) and other reports whole.
+    """
+    texts = []
+    owners = []
+    for position, item_id in enumerate(item_ids):
+        segments = span_segments.get(item_id)
+        if segments is None:
+            texts.append(unique_reports[item_id])
+            owners.append(position)
+            continue
+        for segment in segments:
+            if segment.category is None:
+                texts.append(segment.text)
+                owners.append(position)
+    return texts, owners
+
+
+def merge_spans(item_ids, span_segments, owners, indexed_texts, failed_texts):
+    """
+    Reassembles the parsed texts returned by expand_spans into reports keyed by position in the group,
+    with the locally known units and the units of the spans in their original order.
+    A report fails if any of its spans failed. Returns (indexed reports, failed positions).
+    """
+    failed_positions = sorted({owners[text_position] for text_position in failed_texts})
+    text_results = {}
+    for text_position, report in sorted(indexed_texts.items()):
+        text_results.setdefault(owners[text_position], []).append(report)
+
+    indexed_reports = {}
+    for position, item_id in enumerate(item_ids):
+        if position in failed_positions:
+            continue
+        results = iter(text_results.get(position, []))
+        segments = span_segments.get(item_id)
+        if segments is None:
+            indexed_reports[position] = next(results)
+            continue
+        units = []
+        for segment in segments:
+            if segment.category is None:
+                units.extend(next(results)["lexicon_units"])
+            else:
+                units.append({"unit": segment.text, "category": segment.category})
+        backends = dict.fromkeys(report.get("backend") for report in text_results.get(position, []))
+        indexed_reports[position] = {"report_index": position, "lexicon_units": units,
+                                     "backend": '+'.join(['local', *filter(None, backends)])}
+    return indexed_reports, failed_positions
+
+
+def process_reports(input_file, output_file, reports_per_group, max_workers=1,
+                    requests_per_minute=None, tokens_per_minute=None, checkpoint_dir=None,
+                    cache_file=None, cache_max_bytes=None, normalize_duplicates=False,
+                    target_input_tokens=None, backend=None, streaming=False, event_log_file=None,
+                    metrics_file=None, metrics_port=None, progress_interval=10, presegment_mode=None,
+                    presegment_unit_files=(), presegment_radlex_files=(), presegment_min_count=2, on_rows=None,
+                    overwrite_output=False, metrics_host='127.0.0.1'):
+    """
+    Processes all reports in groups, keeping up to max_workers groups in flight at once.
+    Groups hold at most reports_per_group reports and are packed to target_input_tokens and to the model's
+    output token limit; truncated responses make later groups smaller.
+    Results are checkpointed in group order to an append-only store under checkpoint_dir
+    (default: "<output_file>.checkpoint") and written to output_file once at the end. An output_file without
+    a checkpoint is only replaced with overwrite_output (see CheckpointStore.for_output).
+    Parsed responses are cached in the SQLite file cache_file when it is given.
+    Duplicate reports are sent only once; their units are written for every input row (Row Index) they appear in.
+    Requests go to backend (default: the backend or backend pool configured above), streamed when streaming is
+    set; the Backend column records which backend produced each row. requests_per_minute and tokens_per_minute
+    do not apply to a backend pool, whose members have their own limits.
+    Per-group performance measurements are written to the JSONL event_log_file and as Prometheus metrics to
+    metrics_file and/or metrics_host:metrics_port (see instrumentation.Instrumentation), with a live
+    throughput/ETA summary every progress_interval seconds.
+    With presegment_mode, reports covered by the units of earlier outputs are segmented locally first
+    (see presegment_reports).
+    on_rows, if given, is called with the output rows of every finished group, in group order, before they are
+    checkpointed; it may block to hold back processing (see pipeline.py).
+    Returns a summary of the run: group count, elapsed seconds, per-group latencies, checkpoint and export
+    time and token usage.
+    """
+    unique_reports, occurrences = read_reports(input_file, normalize_duplicates)
+    # Rows are checkpointed as append-only shards next to the output file
+    store = open_checkpoint(output_file, occurrences, checkpoint_dir, overwrite_output)
+
+    # Reports made up of known units are resolved without the model
+    span_segments = {}
+    if presegment_mode:
+        segmenter = build_segmenter(presegment_unit_files, presegment_radlex_files, presegment_min_count)
+        span_segments = presegment_reports(unique_reports, store, segmenter, presegment_mode, on_rows=on_rows)
+
+    # Skip reports that already finished in an earlier run and group the rest to the token budget
+    prompt_texts = {item_id: '\n'.join(segment.text for segment in segments if segment.category is None)
+                    for item_id, segments in span_segments.items()}
+    planner, pending_groups, remaining_items = plan_report_groups(unique_reports, store, reports_per_group,
+                                                                 target_input_tokens, prompt_texts)
+
+    def process_items(item_ids, group_index, backend, rate_limiter, response_cache, metrics):
+        texts, owners = expand_spans(item_ids, unique_reports, span_segments)
+        indexed_texts, failed_texts = process_group(texts, group_index, backend, planner,
+                                                    rate_limiter=rate_limiter, response_cache=response_cache,
+                                                    streaming=streaming, metrics=metrics)
+        return merge_spans(item_ids, span_segments, owners, indexed_texts, failed_texts)
+
+    owns_backend = backend is None
+    if owns_backend:
+        backend = create_model_pool(backend_pool) if backend_pool else create_model_backend(backend_name)
+    return run_groups('unit_parsing', store, unique_reports, pending_groups, remaining_items, process_items,
+                      build_report_rows, output_file, OUTPUT_COLUMNS, INTEGER_COLUMNS, backend,
+                      max_workers=max_workers, requests_per_minute=requests_per_minute,
+                      tokens_per_minute=tokens_per_minute, cache_file=cache_file, cache_max_bytes=cache_max_bytes,
+                      event_log_file=event_log_file, metrics_file=metrics_file, metrics_port=metrics_port,
+                      metrics_host=metrics_host, progress_interval=progress_interval, on_rows=on_rows,
+                      close_backend=owns_backend)
+
+
+def write_report_batch(input_file, output_file, batch_dir, reports_per_group, checkpoint_dir=None,
+                       normalize_duplicates=False, target_input_tokens=None, overwrite_output=False):
+    """
+    Writes the prompts of all groups that have not finished yet as a sharded batch job in batch_dir
+    (see runner.write_batch). Run ingest_report_batch on the results file afterwards.
+    """
+    unique_reports, occurrences = read_reports(input_file, normalize_duplicates)
+    store = open_checkpoint(output_file, occurrences, checkpoint_dir, overwrite_output)
+    _, pending_groups, _ = plan_report_groups(unique_reports, store, reports_per_group, target_input_tokens)
+    write_batch('unit_parsing', unique_reports, pending_groups, generate_prompt, batch_dir, generation_config,
+                SAFETY_SETTINGS)
+
+
+def ingest_report_batch(batch_dir, results_file, output_file, checkpoint_dir=None, overwrite_output=False):
+    """
+    Ingests a batch results JSONL file and writes the output file (see runner.ingest_batch).
+    Reports that are missing or invalid are marked failed, so the next run (synchronous or batch) sends only them.
+    """
+    ingest_batch(batch_dir, results_file, 'reports', lambda reports, group: index_reports(reports, len(group)),
+                 build_report_rows, f"batch:{model_name}", output_file, OUTPUT_COLUMNS, INTEGER_COLUMNS,
+                 checkpoint_dir, overwrite_output)
+
+def report_options():
+    """
+    Returns the process_reports keyword arguments given by the settings above.
+    """
+    return dict(reports_per_group=reports_per_group, max_workers=max_workers,
+                requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, cache_file=cache_file,
+                cache_max_bytes=cache_max_bytes, normalize_duplicates=normalize_duplicates,
+                target_input_tokens=target_input_tokens, streaming=streaming, event_log_file=event_log_file,
+                metrics_file=metrics_file, metrics_port=metrics_port, metrics_host=metrics_host,
+                progress_interval=progress_interval, presegment_mode=presegment_mode,
+                presegment_unit_files=presegment_unit_files, presegment_radlex_files=presegment_radlex_files,
+                presegment_min_count=presegment_min_count, overwrite_output=overwrite_output)
+
+
+def run():
+    """
+    Processes the reports in run_mode with the settings above.
+    """
+    if run_mode == 'batch-write':
+        write_report_batch(input_file, output_file, batch_dir, reports_per_group=reports_per_group,
+                           normalize_duplicates=normalize_duplicates, target_input_tokens=target_input_tokens,
+                           overwrite_output=overwrite_output)
+    elif run_mode == 'batch-ingest':
+        ingest_report_batch(batch_dir, batch_results_file, output_file, overwrite_output=overwrite_output)
+    else:
+        return process_reports(input_file, output_file, **report_options())
+
+
+# Process the reports
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,163 @@
+import pytest
+
+from radlex_expansion import backend_pool
+from radlex_expansion.backend_pool import BackendPool, PoolMember, served_by, tag_backend
+from radlex_expansion.backends import MockBackend, ModelResponse, TokenUsage
+
+
+class ScriptedBackend:
+    """
+    Answers every prompt with its model name, or raises the next error of errors while there are any.
+    """
+
+    name = 'scripted'
+    generation_config = {}
+
+    def __init__(self, model_name, errors=()):
+        self.model_name = model_name
+        self.errors = list(errors)
+        self.usage = TokenUsage()
+        self.calls = 0
+        self.closed = False
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return ModelResponse(self.model_name, 'STOP', 10, 5)
+
+    def stream(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        yield ModelResponse(self.model_name[:1], None, None, None)
+        yield ModelResponse(self.model_name[1:], 'STOP', 10, 5)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock:
+    """
+    Stands in for the time module in backend_pool: sleeping advances the clock instead of waiting.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(backend_pool, 'time', clock)
+    return clock
+
+
+def make_pool(*backends, **options):
+    pool = BackendPool([PoolMember(backend) for backend in backends], **options)
+    pool._rotation = len(pool.members) - 1  # The first request goes to the first member
+    return pool
+
+
+def test_requests_take_turns_across_members(clock):
+    first, second = ScriptedBackend('a'), ScriptedBackend('b')
+    pool = make_pool(first, second)
+    labels = []
+    for _ in range(4):
+        pool.generate('prompt')
+        labels.append(served_by(pool))
+    assert sorted(labels) == ['scripted:a', 'scripted:a', 'scripted:b', 'scripted:b']
+    assert pool.model_name == 'a+b'
+    assert pool.usage.summary()['calls'] == 4
+
+
+def test_quota_error_fails_over_and_opens_the_circuit(clock):
+    first, second = ScriptedBackend('a', [RuntimeError("429 quota exceeded")]), ScriptedBackend('b')
+    pool = make_pool(first, second, cooldown=30.0)
+
+    assert pool.generate('prompt').text == 'b'
+    assert served_by(pool) == 'scripted:b'
+    assert [status['state'] for status in pool.health()] == ['open', 'closed']
+    # The open member gets no requests until it cools down
+    for _ in range(3):
+        assert pool.generate('prompt').text == 'b'
+    assert first.calls == 1
+
+    # After the cooldown a single trial request closes the circuit again
+    clock.now += 30.0
+    while first.calls == 1:
+        pool.generate('prompt')
+    assert pool.health()[0]['state'] == 'closed'
+
+
+def test_consecutive_transport_errors_open_the_circuit(clock):
+    backend = ScriptedBackend('a', [ConnectionError("reset")] * 2)
+    pool = make_pool(backend, failure_threshold=2, cooldown=10.0)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.generate('prompt')
+    assert pool.health()[0]['state'] == 'open'
+    assert pool.health()[0]['failures'] == 2
+
+    # With every circuit open, the request waits for the first one to reopen
+    assert pool.generate('prompt').text == 'a'
+    assert sum(clock.sleeps) >= 10.0
+    assert pool.health()[0]['state'] == 'closed'
+
+
+def test_a_failing_trial_request_doubles_the_cooldown(clock):
+    backend = ScriptedBackend('a', [RuntimeError("429 quota exceeded")] * 2)
+    pool = make_pool(backend, cooldown=10.0, max_cooldown=15.0)
+    with pytest.raises(RuntimeError):
+        pool.generate('prompt')
+    assert pool.members[0].cooldown == 10.0
+    clock.now += 10.0
+    with pytest.raises(RuntimeError):
+        pool.generate('prompt')
+    assert pool.members[0].cooldown == 15.0
+    assert pool.members[0].reopen_at == clock.now + 15.0
+
+
+def test_errors_about_the_prompt_are_not_failed_over(clock):
+    first = ScriptedBackend('a', [RuntimeError("Response blocked by safety filters")])
+    second = ScriptedBackend('b')
+    pool = make_pool(first, second)
+    with pytest.raises(RuntimeError):
+        pool.generate('prompt')
+    assert second.calls == 0
+    assert pool.health()[0]['state'] == 'closed'
+
+
+def test_stream_fails_over_before_the_first_chunk(clock):
+    first, second = ScriptedBackend('a', [ConnectionError("reset")]), ScriptedBackend('bc')
+    pool = make_pool(first, second)
+    chunks = list(pool.stream('prompt'))
+    assert ''.join(chunk.text for chunk in chunks) == 'bc'
+    assert served_by(pool) == 'scripted:bc'
+    assert pool.usage.summary()['calls'] == 1
+
+
+def test_close_closes_every_member(clock):
+    backends = [ScriptedBackend('a'), ScriptedBackend('b')]
+    make_pool(*backends).close()
+    assert all(backend.closed for backend in backends)
+
+
+def test_pool_needs_members():
+    with pytest.raises(ValueError):
+        BackendPool([])
+
+
+def test_served_by_and_tag_backend():
+    backend = MockBackend(model_name='m')
+    assert served_by(backend) == 'mock:m'
+    results = tag_backend([{'term': 'lung'}, {'term': 'liver', 'backend': 'cache'}, 'error'], 'mock:m')
+    assert results == [{'term': 'lung', 'backend': 'mock:m'}, {'term': 'liver', 'backend': 'cache'}, 'error']
@@ -0,0 +1,101 @@
+import csv
+import glob
+import json
+import os
+
+from radlex_expansion import radlex_synonym, unit_parsing
+from radlex_expansion.batch_jobs import load_batch_groups, make_custom_id, read_batch_results, write_batch_requests
+from radlex_expansion.checkpoint import CheckpointStore
+
+
+def answer_batch(batch_dir, results_file, synthesize, skip=()):
+    """
+    Answers every request of a batch job with a synthesized response in the Gemini batch results format,
+    except the requests whose custom IDs are in skip.
+    """
+    with open(results_file, 'w', encoding='utf-8') as results:
+        for path in sorted(glob.glob(os.path.join(batch_dir, 'requests-*.jsonl'))):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    request = json.loads(line)
+                    if request['key'] in skip:
+                        continue
+                    prompt = request['request']['contents'][0]['parts'][0]['text']
+                    response = {'candidates': [{'content': {'parts': [{'text': synthesize(prompt)}]},
+                                                'finishReason': 'STOP'}]}
+                    results.write(json.dumps({'key': request['key'], 'response': response}) + '\n')
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_write_batch_requests_shards_requests_and_records_groups(tmp_path):
+    requests = [(make_custom_id('test', number, 'hash'), f"prompt {number}", {'group_index': number})
+                for number in range(5)]
+    paths = write_batch_requests(str(tmp_path), requests, {'temperature': 0.0}, shard_size=2)
+    assert [os.path.basename(path) for path in paths] == [
+        'requests-00000.jsonl', 'requests-00001.jsonl', 'requests-00002.jsonl']
+    with open(paths[0], encoding='utf-8') as f:
+        first = json.loads(f.readline())
+    assert first['key'] == 'test-g0000000-hash'
+    assert first['request']['contents'][0]['parts'][0]['text'] == 'prompt 0'
+    assert first['request']['generation_config'] == {'temperature': 0.0}
+
+
+def test_read_batch_results_accepts_gemini_and_openai_lines(tmp_path):
+    results_file = tmp_path / 'results.jsonl'
+    results_file.write_text('\n'.join(json.dumps(line) for line in [
+        {'key': 'a', 'response': {'candidates': [{'content': {'parts': [{'text': 'x'}]}, 'finishReason': 'STOP'}]}},
+        {'custom_id': 'b', 'response': {'body': {'choices': [{'message': {'content': 'y'},
+                                                               'finish_reason': 'length'}]}}},
+        {'key': 'c', 'error': {'code': 500}},
+    ]) + '\n')
+    assert list(read_batch_results(str(results_file))) == [
+        ('a', 'x', 'STOP', None), ('b', 'y', 'MAX_TOKENS', None), ('c', None, None, {'code': 500})]
+
+
+def test_report_batch_round_trip(tmp_path):
+    input_file = tmp_path / 'reports.csv'
+    input_file.write_text(''.join(f"report {number} with a few words\n" for number in range(5))
+                          + "report 0 with a few words\n")
+    output_file = str(tmp_path / 'units.csv')
+    batch_dir = str(tmp_path / 'batch')
+    results_file = str(tmp_path / 'results.jsonl')
+
+    unit_parsing.write_report_batch(str(input_file), output_file, batch_dir, reports_per_group=2)
+    answer_batch(batch_dir, results_file, unit_parsing.synthesize_response)
+    unit_parsing.ingest_report_batch(batch_dir, results_file, output_file)
+
+    rows = read_csv(output_file)
+    assert sorted({int(row['Row Index']) for row in rows}) == list(range(6))
+    assert {row['Backend'] for row in rows} == {f"batch:{unit_parsing.model_name}"}
+    # The duplicate report gets the units of its first occurrence
+    units = {}
+    for row in rows:
+        units.setdefault(int(row['Row Index']), []).append(row['Unit'])
+    assert units[5] == units[0] == ['report 0 with', 'a few words']
+
+
+def test_lexicon_batch_resends_only_failed_and_missing_groups(tmp_path):
+    input_file = tmp_path / 'radlex.csv'
+    input_file.write_text('Preferred Label\nlung\nupper lobe\nliver\nkidney\nspleen\n')
+    output_file = str(tmp_path / 'synonyms.csv')
+    batch_dir = str(tmp_path / 'batch')
+    results_file = str(tmp_path / 'results.jsonl')
+
+    radlex_synonym.write_lexicon_batch(str(input_file), output_file, batch_dir, lexicon_per_group=2)
+    keys = list(load_batch_groups(batch_dir))
+    answer_batch(batch_dir, results_file, radlex_synonym.synthesize_response, skip={keys[2]})
+    # The second group's request failed at the batch endpoint
+    lines = (tmp_path / 'results.jsonl').read_text().splitlines()
+    lines[1] = json.dumps({'key': keys[1], 'error': {'code': 500, 'message': 'internal error'}})
+    (tmp_path / 'results.jsonl').write_text('\n'.join(lines) + '\n')
+    radlex_synonym.ingest_lexicon_batch(batch_dir, results_file, output_file)
+
+    rows = read_csv(output_file)
+    assert [row['term'] for row in rows] == ['lung', 'upper lobe', 'error', 'error']
+    # The next run sends only the terms of the failed and the missing group
+    store = CheckpointStore(f"{output_file}.checkpoint")
+    assert store.manifest.prepare_resume(['lung', 'upper lobe', 'liver', 'kidney', 'spleen']) == {0, 1}
@@ -0,0 +1,63 @@
+from radlex_expansion.batch_planner import BatchPlanner, looks_truncated
+
+
+def items(count, words=1):
+    return [(item_id, ' '.join(['word'] * words)) for item_id in range(count)]
+
+
+def test_plan_packs_up_to_max_items():
+    planner = BatchPlanner(4)
+    assert list(planner.plan(items(10))) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_plan_closes_groups_at_the_input_token_budget():
+    planner = BatchPlanner(100, target_input_tokens=25)
+    groups = list(planner.plan(items(6, words=10)))
+    assert all(len(group) < 6 for group in groups)
+    assert [item_id for group in groups for item_id in group] == list(range(6))
+
+
+def test_plan_keeps_an_item_larger_than_the_budget_in_its_own_group():
+    planner = BatchPlanner(10, target_input_tokens=5)
+    assert list(planner.plan([(0, 'word ' * 100), (1, 'word')])) == [[0], [1]]
+
+
+def test_truncation_halves_the_group_size():
+    planner = BatchPlanner(8)
+    planner.record_truncation(8)
+    assert planner.max_items == 4
+    assert planner.output_ratio == 6.0
+    assert list(planner.plan(items(6))) == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_truncation_of_a_small_group_rounds_up():
+    planner = BatchPlanner(8)
+    planner.record_truncation(3)
+    assert planner.max_items == 2
+
+
+def test_truncation_of_a_single_item_is_ignored():
+    planner = BatchPlanner(8)
+    planner.record_truncation(1)
+    assert planner.max_items == 8
+    assert planner.output_ratio == 4.0
+
+
+def test_truncation_of_a_group_planned_earlier_does_not_shrink_further():
+    planner = BatchPlanner(8)
+    planner.record_truncation(8)
+    planner.record_truncation(8)  # A second group of 8 that was already in flight
+    assert planner.max_items == 4
+
+
+def test_successes_grow_the_group_size_back():
+    planner = BatchPlanner(8)
+    planner.record_truncation(8)
+    for _ in range(10):
+        planner.record_success(100, 400)
+    assert planner.max_items == 5
+
+
+def test_looks_truncated_ignores_braces_inside_strings():
+    assert looks_truncated('{"reports": [{"unit": "a"')
+    assert not looks_truncated('{"reports": [{"unit": "{["}]}')
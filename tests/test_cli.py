@@ -0,0 +1,93 @@
+import types
+
+import pytest
+
+from radlex_expansion import pipeline, radlex_index, radlex_synonym, unit_parsing
+from radlex_expansion.cli import apply_settings, is_placeholder, main, parse_value
+
+
+@pytest.fixture(autouse=True)
+def restore_settings(monkeypatch):
+    """
+    Restores the module settings the command line overrides, and records the runs instead of starting them.
+    """
+    runs = []
+    modules = [unit_parsing, radlex_synonym, pipeline, radlex_index]
+    saved = [dict(vars(module)) for module in modules]
+    for module in modules:
+        monkeypatch.setattr(module, 'run', lambda module=module: runs.append(module.__name__))
+    yield runs
+    for module, settings in zip(modules, saved):
+        vars(module).update(settings)
+
+
+def test_parse_value_reads_toml_values_else_strings():
+    assert parse_value('16') == 16
+    assert parse_value('true') is True
+    assert parse_value('[1, 2]') == [1, 2]
+    assert parse_value('"16"') == '16'
+    assert parse_value('reports.xlsx') == 'reports.xlsx'
+
+
+def test_is_placeholder():
+    assert is_placeholder('####')
+    assert not is_placeholder('')
+    assert not is_placeholder(None)
+    assert not is_placeholder('#1')
+
+
+def test_apply_settings_rejects_unknown_names():
+    module = types.ModuleType('settings')
+    module.max_workers = 8
+    module.run = lambda: None
+    module._private = 1
+    apply_settings(module, {'max_workers': 16}, 'test')
+    assert module.max_workers == 16
+    for name in ['max_worker', 'run', '_private']:
+        with pytest.raises(ValueError):
+            apply_settings(module, {name: 1}, 'test')
+
+
+def test_config_file_and_command_line_settings(tmp_path, restore_settings):
+    config = tmp_path / 'radlex.toml'
+    config.write_text('[unit_parsing]\ninput_file = "reports.xlsx"\noutput_file = "units.csv"\nmax_workers = 4\n'
+                      '[radlex_synonym]\nmax_workers = 2\n')
+    assert main(['--config', str(config), 'unit-parsing', '--output', 'other.csv', '--backend', 'mock',
+                 '--set', 'max_workers=16', '--set', 'streaming=true']) == 0
+    assert restore_settings == ['radlex_expansion.unit_parsing']
+    assert (unit_parsing.input_file, unit_parsing.output_file) == ('reports.xlsx', 'other.csv')
+    assert (unit_parsing.max_workers, unit_parsing.streaming, unit_parsing.backend_name) == (16, True, 'mock')
+    # Tables of other modules are not applied, and a placeholder key is left to the SDK's environment variable
+    assert radlex_synonym.max_workers != 2
+    assert unit_parsing.api_key is None
+
+
+def test_pipeline_falls_back_to_unit_parsing_settings(tmp_path, restore_settings):
+    config = tmp_path / 'radlex.toml'
+    config.write_text('[unit_parsing]\ninput_file = "reports.xlsx"\noutput_file = "units.csv"\n'
+                      '[pipeline]\nradlex_synonym_file = "synonyms.csv"\n')
+    main(['--config', str(config), 'pipeline', '--output', 'mapped.csv', '--set', 'max_workers=3',
+          '--set', 'mapping_processes=2'])
+    assert restore_settings == ['radlex_expansion.pipeline']
+    assert pipeline.mapped_output_file == 'mapped.csv'
+    assert pipeline.mapping_processes == 2
+    assert unit_parsing.max_workers == 3
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['unit-parsing', '--input', 'reports.xlsx'], 'unit_parsing.output_file is not set'),
+    (['radlex-synonym', '--run-mode', 'batch-ingest', '--output', 'synonyms.csv'],
+     'radlex_synonym.batch_dir is not set'),
+    (['unit-parsing', '--set', 'max_worker=4'], "has no setting 'max_worker'"),
+    (['unit-parsing', '--set', 'max_workers'], 'expects NAME=VALUE'),
+    (['pipeline', '--run-mode', 'batch-write'], 'unrecognized arguments: --run-mode'),
+    (['pipeline', '--set', 'run_mode="batch-write"'], 'pipeline has no batch run mode'),
+    (['build-index', '--run-mode', 'sync'], 'unrecognized arguments: --run-mode'),
+])
+def test_invalid_settings_are_usage_errors(argv, message, capsys, restore_settings):
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err
+    assert restore_settings == []
+
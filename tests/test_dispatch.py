@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from radlex_expansion import dispatch
+from radlex_expansion.dispatch import RateLimiter, dispatch_groups, estimate_tokens
+
+
+class FakeClock:
+    """
+    Stands in for the time module in dispatch: sleeping advances the clock instead of waiting.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(dispatch, 'time', clock)
+    return clock
+
+
+# dispatch_groups
+
+def test_dispatch_yields_outcomes_in_group_order():
+    # Earlier groups take longer, so they finish last
+    def worker(group, group_index):
+        time.sleep(0.01 * (5 - group_index))
+        return [item.upper() for item in group]
+
+    groups = [(index, [f"item {index}"]) for index in range(5)]
+    outcomes = list(dispatch_groups(groups, worker, max_workers=5))
+    assert [outcome.group_index for outcome in outcomes] == [0, 1, 2, 3, 4]
+    assert [outcome.result for outcome in outcomes] == [[f"ITEM {index}"] for index in range(5)]
+    assert all(outcome.elapsed >= 0 and outcome.queue_wait >= 0 for outcome in outcomes)
+
+
+def test_dispatch_runs_groups_concurrently():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def worker(group, group_index):
+        with lock:
+            running.append(group_index)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(group_index)
+
+    list(dispatch_groups(((index, []) for index in range(8)), worker, max_workers=4))
+    assert 1 < max(peak) <= 4
+
+
+def test_dispatch_plans_groups_lazily():
+    planned = []
+
+    def groups():
+        for index in range(100):
+            planned.append(index)
+            yield index, [index]
+
+    outcomes = dispatch_groups(groups(), lambda group, group_index: group, max_workers=2, max_pending=4)
+    next(outcomes)
+    # Only a bounded backlog is planned ahead of the outcomes consumed so far
+    assert len(planned) <= 5
+    outcomes.close()
+
+
+def test_dispatch_raises_worker_errors():
+    def worker(group, group_index):
+        if group_index == 1:
+            raise RuntimeError("worker failed")
+        return group
+
+    with pytest.raises(RuntimeError):
+        list(dispatch_groups(((index, []) for index in range(3)), worker, max_workers=2))
+
+
+# RateLimiter
+
+def test_rate_limiter_lets_a_full_bucket_through_then_waits(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(30)
+    assert clock.sleeps == [pytest.approx(30)]
+
+
+def test_rate_limiter_waits_for_token_quota(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    assert limiter.acquire(500) == 0
+    # 400 more tokens need 300 tokens more than are left, which refill in 30 seconds
+    assert limiter.acquire(400) == pytest.approx(30)
+
+
+def test_rate_limiter_caps_requests_larger_than_the_bucket(clock):
+    limiter = RateLimiter(tokens_per_minute=100)
+    assert limiter.acquire(1000) == 0
+    assert limiter.acquire(1000) == pytest.approx(60)
+
+
+def test_rate_limiter_without_quotas_never_waits(clock):
+    limiter = RateLimiter()
+    assert all(limiter.acquire(10 ** 6) == 0 for _ in range(100))
+    assert clock.sleeps == []
+
+
+def test_estimate_tokens_counts_about_four_characters_per_token():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('x' * 400) == 100
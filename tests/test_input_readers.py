@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from radlex_expansion.input_readers import input_format, iter_input_column
+
+
+def test_input_format_by_extension():
+    assert input_format('reports.XLSX') == 'excel'
+    assert input_format('reports.ndjson') == 'jsonl'
+    with pytest.raises(ValueError):
+        input_format('reports.txt')
+
+
+def test_csv_by_name_or_position(tmp_path):
+    path = tmp_path / 'radlex.csv'
+    # A byte order mark from Excel must not end up in the first header name
+    path.write_text('\ufeffPreferred Label,Definition\nlung,organ\n"upper lobe, left",\n,\n', encoding='utf-8')
+    assert list(iter_input_column(str(path), column='Preferred Label')) == ['lung', 'upper lobe, left', '']
+    assert list(iter_input_column(str(path), column=1)) == ['organ', '', '']
+
+
+def test_csv_without_header(tmp_path):
+    path = tmp_path / 'reports.csv'
+    path.write_text('first report\nsecond report\n')
+    assert list(iter_input_column(str(path), column=0, header=False)) == ['first report', 'second report']
+
+
+def test_csv_unknown_column(tmp_path):
+    path = tmp_path / 'radlex.csv'
+    path.write_text('Label\nlung\n')
+    with pytest.raises(ValueError):
+        list(iter_input_column(str(path), column='Preferred Label'))
+
+
+def test_jsonl_objects_lists_and_values(tmp_path):
+    path = tmp_path / 'reports.jsonl'
+    path.write_text('\n'.join(json.dumps(line) for line in [
+        {'report': 'first', 'id': 1}, {'id': 2}, 'third', ['fourth', 'x'], None]) + '\n\n')
+    assert list(iter_input_column(str(path), column='report')) == ['first', '', 'third', '', '']
+    assert list(iter_input_column(str(path), column=0)) == ['first', '2', 'third', 'fourth', '']
+
+
+def test_excel_sheet_and_header(tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'Notes'
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(['Preferred Label', 'Definition'])
+    sheet.append(['lung', 'organ'])
+    sheet.append([None, 'missing label'])
+    sheet.append([42])
+    path = str(tmp_path / 'radlex.xlsx')
+    workbook.save(path)
+    assert list(iter_input_column(path, column='Preferred Label', sheet_name='Sheet1')) == ['lung', '', '42']
+
+
+def test_parquet_in_batches(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'reports.parquet')
+    pq.write_table(pa.table({'id': list(range(5)), 'report': [f"report {n}" for n in range(4)] + [None]}), path)
+    assert list(iter_input_column(path, column='report', batch_size=2)) == [
+        'report 0', 'report 1', 'report 2', 'report 3', '']
+    assert list(iter_input_column(path, column=0)) == ['0', '1', '2', '3', '4']
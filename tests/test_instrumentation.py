@@ -0,0 +1,21 @@
+import socket
+import urllib.request
+
+from radlex_expansion.instrumentation import Instrumentation
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_metrics_server_listens_on_loopback_by_default():
+    port = free_port()
+    instrumentation = Instrumentation('unit_parsing', 3, metrics_port=port)
+    try:
+        assert instrumentation._server.server_address == ('127.0.0.1', port)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert b'unit_parsing' in response.read()
+    finally:
+        instrumentation.close()
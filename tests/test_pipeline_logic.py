@@ -0,0 +1,307 @@
+import json
+
+import pytest
+
+from radlex_expansion import checkpoint, failure_isolation, radlex_synonym, runner, unit_parsing
+from radlex_expansion.backends import MockBackend, prompt_key
+from radlex_expansion.batch_planner import TruncatedResponseError
+from radlex_expansion.checkpoint import CheckpointStore, group_hash
+from radlex_expansion.failure_isolation import MalformedResponseError, isolate_failures
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retries back off with time.sleep; the tests do not need to wait for them
+    monkeypatch.setattr(failure_isolation.time, 'sleep', lambda seconds: None)
+
+
+def report(index, units=(("unit", 1),)):
+    return {"report_index": index, "lexicon_units": [{"unit": unit, "category": category} for unit, category in units]}
+
+
+# isolate_failures
+
+def test_isolate_failures_requests_only_missing_items():
+    calls = []
+
+    def request(items):
+        calls.append(list(items))
+        # The first response leaves out every other item
+        returned = items[::2] if len(calls) == 1 else items
+        return {items.index(item): item.upper() for item in returned}
+
+    results, failed = isolate_failures(['a', 'b', 'c', 'd'], request, 0)
+    assert results == {0: 'A', 1: 'B', 2: 'C', 3: 'D'}
+    assert failed == []
+    assert calls == [['a', 'b', 'c', 'd'], ['b', 'd']]
+
+
+def test_isolate_failures_bisects_to_the_bad_item():
+    errors = []
+
+    def request(items):
+        if 'bad' in items:
+            raise MalformedResponseError("Response is not valid JSON.")
+        return {position: item.upper() for position, item in enumerate(items)}
+
+    group = ['a', 'b', 'bad', 'c', 'd']
+    results, failed = isolate_failures(group, request, 0,
+                                       on_error=lambda error_class, count: errors.append(error_class))
+    assert failed == [2]
+    assert results == {0: 'A', 1: 'B', 3: 'C', 4: 'D'}
+    assert set(errors) == {'malformed'}
+
+
+def test_isolate_failures_keeps_items_before_a_truncation():
+    calls = []
+
+    def request(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise TruncatedResponseError("Response reached the output token limit.", {0: 'A', 1: 'B'})
+        return {position: item.upper() for position, item in enumerate(items)}
+
+    results, failed = isolate_failures(['a', 'b', 'c'], request, 0)
+    assert results == {0: 'A', 1: 'B', 2: 'C'}
+    assert failed == []
+    assert calls == [['a', 'b', 'c'], ['c']]
+
+
+def test_isolate_failures_retries_quota_errors_without_splitting():
+    calls = []
+
+    def request(items):
+        calls.append(list(items))
+        if len(calls) < 4:
+            raise RuntimeError("429 quota exceeded")
+        return {position: item for position, item in enumerate(items)}
+
+    results, failed = isolate_failures(['a', 'b'], request, 0)
+    assert results == {0: 'a', 1: 'b'}
+    assert failed == []
+    assert calls == [['a', 'b']] * 4
+
+
+def test_isolate_failures_gives_up_on_a_single_bad_item():
+    def request(items):
+        raise MalformedResponseError("No valid JSON object found in the response.")
+
+    results, failed = isolate_failures(['a'], request, 0)
+    assert results == {}
+    assert failed == [0]
+
+
+# index_reports
+
+def test_index_reports_reads_indices_from_one():
+    indexed = unit_parsing.index_reports([report(1), report(2), report(3)], 3)
+    assert sorted(indexed) == [0, 1, 2]
+    assert indexed[0]["report_index"] == 1
+
+
+def test_index_reports_accepts_indices_from_zero():
+    indexed = unit_parsing.index_reports([report(0), report(2)], 3)
+    assert sorted(indexed) == [0, 2]
+
+
+def test_index_reports_drops_a_response_of_ambiguous_base():
+    # Reports 1 and 2 of 3, or reports 1 and 2 of 0..2: either way one report is missing
+    assert unit_parsing.index_reports([report(1, [("A", 1)]), report(2, [("B", 1)])], 3) == {}
+
+
+def test_index_reports_keeps_missing_last_report_of_truncated_response():
+    indexed = unit_parsing.index_reports([report(1), report(2)], 3, complete=False)
+    assert sorted(indexed) == [0, 1]
+
+
+def test_index_reports_matches_by_order_without_indices():
+    reports = [{"lexicon_units": []}, {"lexicon_units": []}]
+    assert sorted(unit_parsing.index_reports(reports, 2)) == [0, 1]
+
+
+def test_index_reports_leaves_out_invalid_reports():
+    reports = [report(1), report(2, [("A", "not a category")]), {"report_index": 3}]
+    assert sorted(unit_parsing.index_reports(reports, 3)) == [0]
+
+
+def test_index_reports_converts_numeric_category_strings():
+    indexed = unit_parsing.index_reports([report(1, [("A", "3")])], 1)
+    assert indexed[0]["lexicon_units"][0]["category"] == 3
+
+
+# index_terms
+
+def synonyms(term):
+    return {"term": term, "category_1": [], "category_2": [], "category_3": [], "category_4": []}
+
+
+def test_index_terms_matches_terms_ignoring_case_and_whitespace():
+    group = ['Ground glass opacity', 'lung']
+    indexed = radlex_synonym.index_terms([synonyms('LUNG'), synonyms(' ground  glass opacity ')], group)
+    assert sorted(indexed) == [0, 1]
+    assert indexed[1]["term"] == 'LUNG'
+
+
+def test_index_terms_drops_unknown_duplicate_and_invalid_results():
+    group = ['lung', 'liver']
+    results = [synonyms('lung'), synonyms('lung'), synonyms('kidney'), dict(synonyms('liver'), category_1='x')]
+    indexed = radlex_synonym.index_terms(results, group)
+    assert list(indexed) == [0]
+
+
+# Requests through the mock backend
+
+def test_process_group_maps_reports_to_their_positions_with_errors():
+    backend = unit_parsing.create_model_backend('mock', error_rate=0.4, truncation_rate=0.3, seed=7)
+    group = [f"report {number} with several words in it" for number in range(8)]
+    results, failed = unit_parsing.process_group(group, 0, backend)
+    assert backend.calls > 1  # With this seed, the first attempt fails
+    assert failed == []
+    assert sorted(results) == list(range(8))
+    for position, result in results.items():
+        assert result["lexicon_units"][0]["unit"] == f"report {position} with"
+        assert result["backend"] == 'mock:mock'
+
+
+def test_process_group_streaming_keeps_terms_in_place():
+    backend = radlex_synonym.create_model_backend('mock', truncation_rate=0.5, seed=3, stream_chunk_size=16)
+    group = ['lung', 'upper lobe', 'ground glass opacity', 'pleural effusion']
+    results, failed = radlex_synonym.process_group(group, 0, backend, streaming=True)
+    assert backend.calls > 1  # With this seed, the first stream is cut off
+    assert failed == []
+    assert {position: result["term"] for position, result in results.items()} == dict(enumerate(group))
+
+
+def test_request_group_drops_response_missing_its_last_report():
+    group = ['first report', 'second report', 'third report']
+    prompt = unit_parsing.generate_prompt(group, 0)
+    response = json.dumps({"reports": [report(1, [("first", 1)]), report(2, [("second", 1)])]})
+    backend = MockBackend(recordings={prompt_key(prompt): {'text': response, 'finish_reason': 'STOP'}})
+    assert unit_parsing.request_group(group, 0, backend) == {}
+
+
+def test_request_group_keeps_complete_reports_of_a_truncated_response():
+    group = ['first report', 'second report', 'third report']
+    prompt = unit_parsing.generate_prompt(group, 0)
+    response = json.dumps({"reports": [report(1, [("first", 1)]), report(2, [("second", 1)]), report(3)]})[:-30]
+    backend = MockBackend(recordings={prompt_key(prompt): {'text': response, 'finish_reason': 'MAX_TOKENS'}})
+    with pytest.raises(TruncatedResponseError) as error:
+        unit_parsing.request_group(group, 0, backend)
+    partial_results = error.value.partial_results
+    assert sorted(partial_results) == [0, 1]
+    assert partial_results[1]["lexicon_units"][0]["unit"] == 'second'
+    assert partial_results[1]["backend"] == 'mock:mock'
+
+
+# Checkpoint manifest
+
+def append_group(store, group_index, items, item_ids, failed_item_ids=()):
+    # A failed item gets an error row, as in radlex_synonym
+    rows = [{'_group': group_index, '_item': item_id,
+             'Unit': 'error' if item_id in failed_item_ids else f"{items[item_id]} #{group_index}"}
+            for item_id in item_ids]
+    store.append(rows, [(group_index, group_hash([items[item_id] for item_id in item_ids]), list(item_ids),
+                         list(failed_item_ids))])
+
+
+def test_prepare_resume_skips_finished_items_and_resends_failed_ones(tmp_path):
+    items = ['a', 'b', 'c', 'd']
+    store = CheckpointStore(str(tmp_path / 'checkpoint'))
+    append_group(store, 0, items, [0, 1])
+    append_group(store, 1, items, [2, 3], failed_item_ids=[3])
+
+    reopened = CheckpointStore(str(tmp_path / 'checkpoint'))
+    assert reopened.manifest.prepare_resume(items) == {0, 1, 2}
+    assert reopened.manifest.next_group_index() == 2
+
+
+def test_prepare_resume_supersedes_groups_whose_items_changed(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoint'))
+    append_group(store, 0, ['a', 'b', 'c'], [0, 1])
+    append_group(store, 1, ['a', 'b', 'c'], [2])
+
+    changed = ['a', 'B', 'c']
+    assert store.manifest.prepare_resume(changed) == {2}
+    assert store.manifest.entries[0]['status'] == 'superseded'
+    assert [row['Unit'] for row in store.iter_rows()] == ['c #1']
+    # Superseding is recorded once and survives reopening the store
+    reopened = CheckpointStore(str(tmp_path / 'checkpoint'))
+    assert reopened.manifest.prepare_resume(changed) == {2}
+
+
+def test_rows_of_an_item_belong_to_its_latest_group(tmp_path):
+    items = ['a', 'b']
+    store = CheckpointStore(str(tmp_path / 'checkpoint'))
+    append_group(store, 0, items, [0, 1], failed_item_ids=[1])
+    assert [row['Unit'] for row in store.iter_rows()] == ['a #0', 'error']
+    append_group(store, 1, items, [1])
+
+    assert store.manifest.item_owners() == {0: 0, 1: 1}
+    assert [row['Unit'] for row in store.iter_rows()] == ['a #0', 'b #1']
+
+
+def test_for_output_refuses_an_output_without_checkpoint(tmp_path):
+    output_file = tmp_path / 'units.csv'
+    output_file.write_text('Unit\nlung\n')
+    with pytest.raises(FileExistsError):
+        CheckpointStore.for_output(str(output_file))
+    assert CheckpointStore.for_output(str(output_file), overwrite=True).shards() == []
+
+
+def test_output_rows_of_an_item_stay_together_for_each_input_row(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoint'))
+    store.record_occurrences([[0, 2], [1]])
+    store.append([{'_group': 0, '_item': 0, 'Unit': 'lung'}, {'_group': 0, '_item': 0, 'Unit': 'liver'},
+                  {'_group': 0, '_item': 1, 'Unit': 'spleen'}],
+                 [(0, group_hash(['a', 'b']), [0, 1], [])])
+
+    rows = [(row['Row Index'], row['Unit']) for row in store.iter_output_rows()]
+    assert rows == [(0, 'lung'), (0, 'liver'), (2, 'lung'), (2, 'liver'), (1, 'spleen')]
+
+
+def test_shards_are_numbered_on_from_the_last_one_without_listing_the_directory(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path / 'checkpoint'))
+    store.append([{'Unit': 'lung'}])
+    reopened = CheckpointStore(str(tmp_path / 'checkpoint'))
+
+    def listdir(path):
+        raise AssertionError("append listed the checkpoint directory")
+
+    monkeypatch.setattr(checkpoint.os, 'listdir', listdir)
+    paths = [reopened.append([{'Unit': 'liver'}]), reopened.append([{'Unit': 'spleen'}])]
+    assert [path[-18:] for path in paths] == ['shard-000001.jsonl', 'shard-000002.jsonl']
+
+
+# Run cleanup
+
+def test_process_reports_releases_resources_when_the_run_fails(tmp_path, monkeypatch):
+    closed = []
+
+    class Backend(MockBackend):
+        def close(self):
+            closed.append('backend')
+
+    class Cache(runner.ResponseCache):
+        def close(self):
+            closed.append('cache')
+            super().close()
+
+    class Instrumentation(runner.Instrumentation):
+        def close(self):
+            closed.append('instrumentation')
+            super().close()
+
+    monkeypatch.setattr(runner, 'ResponseCache', Cache)
+    monkeypatch.setattr(runner, 'Instrumentation', Instrumentation)
+    monkeypatch.setattr(unit_parsing, 'create_model_backend', lambda name: Backend())
+    monkeypatch.setattr(unit_parsing, 'backend_pool', [])
+    input_file = tmp_path / 'reports.csv'
+    input_file.write_text('lung nodule\nliver lesion\n')
+
+    def on_rows(rows):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        unit_parsing.process_reports(str(input_file), str(tmp_path / 'units.csv'), 1,
+                                     cache_file=str(tmp_path / 'cache.db'), on_rows=on_rows)
+    assert sorted(closed) == ['backend', 'cache', 'instrumentation']
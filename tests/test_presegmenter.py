@@ -0,0 +1,71 @@
+import csv
+
+from radlex_expansion.presegmenter import LexiconSegmenter, Segment, build_segmenter, fold_tokens, is_covered
+
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    return str(path)
+
+
+def segmenter(*units):
+    result = LexiconSegmenter()
+    for unit, category in units:
+        result.add(unit, category)
+    return result
+
+
+def test_fold_tokens_splits_on_whitespace_and_hyphens():
+    assert fold_tokens('Ground-glass  Opacity') == ['ground', 'glass', 'opacity']
+
+
+def test_segment_takes_the_longest_known_unit():
+    known = segmenter(('lower lobe', 2), ('lower lobe consolidation', 1), ('lung', 2))
+    assert known.segment('Lower lobe consolidation of the lung') == [
+        Segment('lower lobe consolidation', 1), Segment('lung', 2)]
+
+
+def test_segment_keeps_unknown_spans_without_connecting_words():
+    known = segmenter(('effusion', 1))
+    segments = known.segment('small nodule in the effusion')
+    assert segments == [Segment('small nodule', None), Segment('effusion', 1)]
+    assert not is_covered(segments)
+    assert is_covered(known.segment('Effusion'))
+    assert not is_covered(known.segment(''))
+
+
+def test_add_keeps_the_first_category_of_a_phrase():
+    known = LexiconSegmenter()
+    assert known.add('Lung', 2)
+    assert not known.add('lung', 3)
+    assert known.lookup('LUNG') == ('Lung', 2)
+    assert len(known) == 1
+
+
+def test_build_segmenter_counts_reports_not_rows(tmp_path):
+    columns = ['Group Index', 'Report Index', 'Row Index', 'Unit', 'Category', 'Backend']
+    units = write_csv(tmp_path / 'units.csv', columns, [
+        # A duplicate report fanned out to three input rows is one report
+        [0, 1, 0, 'nodule', 1, 'mock'], [0, 1, 5, 'nodule', 1, 'mock'], [0, 1, 9, 'nodule', 1, 'mock'],
+        [0, 1, 0, 'lung', 2, 'mock'], [0, 2, 1, 'lung', 2, 'mock'],
+        # Units that were segmented locally do not count
+        [1, 1, 2, 'liver', 2, 'local'], [1, 2, 3, 'liver', 2, 'local'],
+    ])
+    known = build_segmenter([units], min_count=2)
+    assert known.lookup('lung') == ('lung', 2)
+    assert known.lookup('nodule') is None
+    assert known.lookup('liver') is None
+
+
+def test_build_segmenter_adds_radlex_variants_of_known_units(tmp_path):
+    units = write_csv(tmp_path / 'units.csv', ['Group Index', 'Report Index', 'Unit', 'Category'],
+                      [[0, 1, 'pleural effusion', 1], [0, 2, 'pleural effusion', 1]])
+    radlex = write_csv(tmp_path / 'radlex.csv', ['term', 'category_1', 'category_2', 'category_3', 'category_4'],
+                       [['pleural effusion', 'hydrothorax|pleural fluid', '', '', ''],
+                        ['kidney', 'renal', '', '', '']])
+    known = build_segmenter([units], [radlex])
+    assert known.lookup('hydrothorax') == ('hydrothorax', 1)
+    assert known.lookup('renal') is None
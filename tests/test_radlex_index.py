@@ -0,0 +1,73 @@
+import csv
+
+import pytest
+
+from radlex_expansion.radlex_index import RadLexIndex, RadLexMatch, build_index, fold_variant
+
+
+def write_synonyms(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Row Index', 'term', 'category_1', 'category_2', 'category_3', 'category_4', 'Backend'])
+        for number, row in enumerate(rows):
+            writer.writerow([number, *row, 'mock'])
+    return str(path)
+
+
+@pytest.fixture
+def index_file(tmp_path):
+    synonyms = write_synonyms(tmp_path / 'synonyms.csv', [
+        ['ground glass opacity', 'ground glass opacities', 'ground-glass opacity', 'GGO', ''],
+        ['pleural effusion', 'pleural effusions', '', '', 'hydrothorax|fluid in the pleural space'],
+        ['error', 'error', 'error', 'error', 'error'],
+        ['myocardial infarction', '', '', 'MI', 'heart attack'],
+        ['mitral insufficiency', '', '', 'MI', 'mitral regurgitation'],
+    ])
+    path = str(tmp_path / 'radlex_index.bin')
+    assert build_index(synonyms, path) == (13, 4)
+    return path
+
+
+def test_fold_variant_normalizes_case_hyphens_and_whitespace():
+    assert fold_variant(' Ground-Glass  opacity ') == 'ground glass opacity'
+    assert fold_variant('air_space') == 'air space'
+
+
+def test_lookup_finds_terms_and_synonyms_by_category(index_file):
+    with RadLexIndex(index_file) as index:
+        assert len(index) == 13
+        assert index.lookup('Ground-Glass Opacity') == RadLexMatch('ground glass opacity', 0)
+        assert index.lookup('ground glass opacities') == RadLexMatch('ground glass opacity', 1)
+        assert index.lookup('ggo') == RadLexMatch('ground glass opacity', 3)
+        assert index.lookup('Fluid in the  pleural space') == RadLexMatch('pleural effusion', 4)
+        assert index.lookup('lung') is None
+        assert index.lookup('') is None
+        assert index.lookup('error') is None
+
+
+def test_lookup_all_returns_every_term_of_an_ambiguous_variant(index_file):
+    with RadLexIndex(index_file) as index:
+        assert sorted(index.lookup_all('MI')) == [RadLexMatch('mitral insufficiency', 3),
+                                                  RadLexMatch('myocardial infarction', 3)]
+
+
+def test_a_variant_keeps_its_lowest_category(tmp_path):
+    # "ground-glass opacity" folds to the term itself
+    synonyms = write_synonyms(tmp_path / 'synonyms.csv', [['ground glass opacity', '', 'ground-glass opacity', '', '']])
+    build_index(synonyms, str(tmp_path / 'index.bin'))
+    with RadLexIndex(str(tmp_path / 'index.bin')) as index:
+        assert len(index) == 1
+        assert index.lookup_all('ground-glass opacity') == [RadLexMatch('ground glass opacity', 0)]
+
+
+def test_lookup_many_matches_lookup(index_file):
+    texts = ['hydrothorax', 'lung', 'hydrothorax', 'heart attack']
+    with RadLexIndex(index_file) as index:
+        assert index.lookup_many(texts) == [index.lookup(text) for text in texts]
+
+
+def test_opening_a_file_that_is_not_an_index_fails(tmp_path):
+    path = tmp_path / 'not_an_index.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        RadLexIndex(str(path))
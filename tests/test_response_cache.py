@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from radlex_expansion import failure_isolation, model_requests, response_cache, unit_parsing
+from radlex_expansion.backends import MockBackend, prompt_key
+from radlex_expansion.response_cache import ResponseCache
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(failure_isolation.time, 'sleep', lambda seconds: None)
+
+
+def report(index, unit):
+    return {"report_index": index, "lexicon_units": [{"unit": unit, "category": 1}]}
+
+
+# ResponseCache
+
+def test_cache_counts_hits_and_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    key = ResponseCache.make_key('prompt', 'model', {'temperature': 0})
+    assert cache.get(key) is None
+    cache.put(key, [{'unit': 'lung'}])
+    assert cache.get(key) == [{'unit': 'lung'}]
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+    cache.close()
+
+
+def test_cache_key_depends_on_model_and_generation_config():
+    key = ResponseCache.make_key('prompt', 'model', {'temperature': 0})
+    assert key == ResponseCache.make_key('prompt', 'model', {'temperature': 0})
+    assert key != ResponseCache.make_key('prompt', 'other model', {'temperature': 0})
+    assert key != ResponseCache.make_key('prompt', 'model', {'temperature': 1})
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(response_cache.time, 'time', lambda: next(clock))
+    value = ['x' * 90]
+    size = len(json.dumps(value))
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_bytes=3 * size)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, value)
+    cache.get('a')  # 'b' and 'c' are now the least recently used entries
+    cache.put('d', value)
+
+    # Going over max_bytes evicts down to 90% of it
+    assert cache.get('b') is None and cache.get('c') is None
+    assert cache.get('a') == value and cache.get('d') == value
+    stats = cache.stats()
+    assert stats['evictions'] == 2
+    assert stats['bytes'] == 2 * size
+    cache.close()
+
+
+def test_cache_size_survives_reopening(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    cache.put('a', ['lung'])
+    cache.close()
+    reopened = ResponseCache(str(tmp_path / 'cache.db'))
+    assert reopened.stats()['bytes'] == len(json.dumps(['lung']))
+    reopened.close()
+
+
+# Caching in request_group and process_group
+
+def recorded_backend(group, reports):
+    prompt = unit_parsing.generate_prompt(group, 0)
+    response = json.dumps({"reports": reports})
+    return MockBackend(recordings={prompt_key(prompt): {'text': response, 'finish_reason': 'STOP'}})
+
+
+def test_request_group_does_not_cache_an_incomplete_response(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    group = ['first report', 'second report', 'third report']
+    backend = recorded_backend(group, [report(1, 'first'), report(2, 'second')])
+    assert unit_parsing.request_group(group, 0, backend, response_cache=cache) == {}
+    assert unit_parsing.request_group(group, 0, backend, response_cache=cache) == {}
+    assert backend.calls == 2
+    assert cache.stats()['entries'] == 0
+    cache.close()
+
+
+def test_request_group_replays_a_complete_response(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    group = ['first report', 'second report']
+    backend = recorded_backend(group, [report(1, 'first'), report(2, 'second')])
+    first = unit_parsing.request_group(group, 0, backend, response_cache=cache)
+    assert unit_parsing.request_group(group, 0, backend, response_cache=cache) == first
+    assert backend.calls == 1
+    assert unit_parsing.request_group(group, 0, backend, response_cache=cache, cache_lookup=False) == first
+    assert backend.calls == 2
+    cache.close()
+
+
+def test_request_group_ignores_an_incomplete_cached_response(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    group = ['first report', 'second report']
+    backend = recorded_backend(group, [report(1, 'first'), report(2, 'second')])
+    key = ResponseCache.make_key(unit_parsing.generate_prompt(group, 0), backend.model_name,
+                                 backend.generation_config)
+    cache.put(key, [report(1, 'first')])
+    assert sorted(unit_parsing.request_group(group, 0, backend, response_cache=cache)) == [0, 1]
+    assert backend.calls == 1
+    assert len(cache.get(key)) == 2
+    cache.close()
+
+
+def test_process_group_looks_up_each_set_of_items_once():
+    lookups = []
+
+    def request(items, cache_lookup):
+        lookups.append((list(items), cache_lookup))
+        if len(lookups) < 3:
+            raise RuntimeError("503 service unavailable")
+        return {position: item for position, item in enumerate(items)}
+
+    results, failed = model_requests.process_group(['a', 'b'], 0, request)
+    assert results == {0: 'a', 1: 'b'}
+    assert lookups == [(['a', 'b'], True), (['a', 'b'], False), (['a', 'b'], False)]